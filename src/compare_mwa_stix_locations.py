@@ -5,6 +5,7 @@ mwa burst localization done via shallow imaging with WSCLEAN (and preforms calib
 """
 from pathlib import Path
 import logging, shutil, subprocess, csv
+from functools import lru_cache
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -19,7 +20,7 @@ from scipy.ndimage import gaussian_filter
 from helper_functions.utils import get_observation_path, get_ms_files, get_root_path_to_data
 import helper_functions.calibration as cal
 from helper_functions.mwa_imaging import run_wsclean
-from helper_functions.selfcal import find_burst_position
+from helper_functions.selfcal import load_frame_cube, find_burst_position_batched
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger("mwa_stix_compare")
@@ -79,15 +80,14 @@ def main():
         )
 
         # localize burst
-        (ra_deg, dec_deg), results = find_burst_position(
-            img_dir, glob_pattern="wsclean-*image.fits",
+        fits_list, cube, frame_times, wcs_ref = load_frame_cube(img_dir, glob_pattern="wsclean-*image.fits")
+        (ra_deg, dec_deg), results = find_burst_position_batched(
+            cube, frame_times, wcs_ref,
             z_thresh=5.0, min_pixels=9, smooth_sigma=1.0,
             bg_sigma=8.0, peak_half_width=4, exclude_limb_px=8, debug=True
         )
+        del cube
         best = best_result_entry(results)
-        fits_list = sorted(img_dir.glob("wsclean-*image.fits"))
-        if not fits_list:
-            raise FileNotFoundError("no fits frames produced for localization")
         best_fits = fits_list[int(best["idx"])]
         log.info(f"picked frame {best['idx']} ({best['mode']}) score {best['score']:.2f}")
 
@@ -147,6 +147,43 @@ def read_stix_earth_hpc(csv_path: Path, flare_id: str):
     raise ValueError(f"flare_id {flare_id} not found in {csv_path}")
 
 
+def _gaussian_kernel_1d(sigma: float, truncate: float = 3.0) -> np.ndarray:
+    """
+    normalized 1d gaussian kernel of radius ceil(truncate*sigma)
+    """
+    r = int(np.ceil(truncate * sigma))
+    x = np.arange(-r, r + 1, dtype=np.float32)
+    k = np.exp(-0.5 * (x / sigma) ** 2)
+    return k / k.sum()
+
+
+def smooth_image(img: np.ndarray, sigma: float) -> np.ndarray:
+    """
+    float32 display smoothing; direct separable filter for small sigma,
+    separable fft convolution once the kernel gets wide
+    """
+    img = img.astype(np.float32, copy=False)
+    if sigma > 4:
+        from scipy.signal import fftconvolve
+        k = _gaussian_kernel_1d(sigma)
+        r = k.size // 2
+        pad = np.pad(img, r, mode="edge")   # match mode='nearest' at the borders
+        out = fftconvolve(fftconvolve(pad, k[:, None], mode="same"), k[None, :], mode="same")
+        return out[r:-r, r:-r].astype(np.float32, copy=False)
+    return gaussian_filter(img, sigma=sigma, truncate=3.0, mode="nearest")
+
+
+@lru_cache(maxsize=64)
+def earth_hpc_frame(obstime_ds: int):
+    """
+    earth-observer helioprojective frame and sun-earth distance, keyed by obstime in
+    deciseconds since mjd 0 so repeated calls for the same frame skip the ephemeris lookups
+    """
+    obstime = Time(obstime_ds / 864000.0, format="mjd", scale="utc")
+    hpc_earth = frames.Helioprojective(obstime=obstime, observer=get_earth(obstime))
+    return hpc_earth, sun.earth_distance(obstime)
+
+
 def plot_compare(fits_path: Path, burst_ra_deg: float, burst_dec_deg: float,
                  stix_tx: float, stix_ty: float, t_mwa_iso: str,
                  t_stix_iso: str, t_stix_peak: str, out_png: Path):
@@ -155,11 +192,11 @@ def plot_compare(fits_path: Path, burst_ra_deg: float, burst_dec_deg: float,
     """
     # read image + header
     with fits.open(fits_path, memmap=False) as hdul:
-        img = np.squeeze(hdul[0].data).astype(float)
+        img = np.squeeze(hdul[0].data).astype(np.float32)
         hdr = hdul[0].header
 
     if SMOOTH_SIGMA and SMOOTH_SIGMA > 0:
-        img = gaussian_filter(img, sigma=SMOOTH_SIGMA)
+        img = smooth_image(img, SMOOTH_SIGMA)
 
     # wcs and obstime
     w2d = WCS(hdr).celestial
@@ -167,22 +204,30 @@ def plot_compare(fits_path: Path, burst_ra_deg: float, burst_dec_deg: float,
         Time(hdr.get("DATE-OBS"), scale="utc") if hdr.get("DATE-OBS") else
         (Time(float(hdr["MJD-OBS"]), format="mjd", scale="utc") if "MJD-OBS" in hdr else Time.now())
     )
-    dist = sun.earth_distance(obstime)
-    hpc_earth = frames.Helioprojective(obstime=obstime, observer=get_earth(obstime))
-
-    # mwa burst in pixel and true hpc
-    c_icrs_mwa = SkyCoord(burst_ra_deg*u.deg, burst_dec_deg*u.deg, frame="icrs", obstime=obstime, distance=dist)
-    bx, by = w2d.world_to_pixel(c_icrs_mwa)
-    c_hpc_mwa = c_icrs_mwa.transform_to(hpc_earth)
-    tx_mwa = float(c_hpc_mwa.Tx.to_value(u.arcsec))
-    ty_mwa = float(c_hpc_mwa.Ty.to_value(u.arcsec))
+    hpc_earth, dist = earth_hpc_frame(round(float(obstime.utc.mjd) * 864000.0))
 
-    # stix earth-hpc to pixel using local linear scale around center
+    # local affine pixel -> hpc map from three reference pixels around the image center,
+    # transformed together with the mwa burst in a single icrs -> hpc call; the field is
+    # small enough for the projection to be linear, so ticks and stix placement reuse it
     ny, nx = img.shape; cx, cy = nx/2.0, ny/2.0
-    cd = np.abs(np.array(w2d.wcs.cdelt)) * 3600.0
-    arcsec_per_pix = float(np.nanmean(cd[:2])) if np.all(np.isfinite(cd[:2])) and np.nanmean(cd[:2])>0 else 10.0
-    sx_pix = cx + stix_tx/arcsec_per_pix
-    sy_pix = cy + stix_ty/arcsec_per_pix
+    c_icrs = w2d.pixel_to_world(np.array([cx, cx + 1.0, cx]), np.array([cy, cy, cy + 1.0])).icrs
+    ra  = np.append(c_icrs.ra.deg,  burst_ra_deg) * u.deg
+    dec = np.append(c_icrs.dec.deg, burst_dec_deg) * u.deg
+    c_all = SkyCoord(ra, dec, frame="icrs", obstime=obstime, distance=dist)
+    c_hpc = c_all.transform_to(hpc_earth)
+    hpc = np.stack([c_hpc.Tx.to_value(u.arcsec), c_hpc.Ty.to_value(u.arcsec)])   # (2, 4)
+    hpc_b = hpc[:, 0]
+    hpc_M = np.column_stack([hpc[:, 1] - hpc_b, hpc[:, 2] - hpc_b])              # d(tx,ty)/d(px,py)
+    def _pix_to_hpc(px, py):
+        return hpc_M @ np.stack([np.asarray(px, float) - cx, np.asarray(py, float) - cy]) + hpc_b[:, None]
+
+    tx_mwa, ty_mwa = float(hpc[0, -1]), float(hpc[1, -1])
+
+    # both markers through the inverse of the same affine icrs -> hpc map the tick labels
+    # use, so a stix centroid at the burst's tx/ty lands on the burst marker
+    (bx, sx_pix), (by, sy_pix) = np.linalg.solve(
+        hpc_M, np.array([[tx_mwa, stix_tx], [ty_mwa, stix_ty]]) - hpc_b[:, None]
+    ) + np.array([[cx], [cy]])
 
     # separation and quick co-spatial flag
     sep_arc = float(np.hypot(tx_mwa - stix_tx, ty_mwa - stix_ty))
@@ -202,21 +247,13 @@ def plot_compare(fits_path: Path, burst_ra_deg: float, burst_dec_deg: float,
     ax.plot(bx, by, marker="x", ms=11, mew=2.0, color="black", linestyle="none", label="radio burst")
     ax.plot(sx_pix, sy_pix, marker="+", ms=12, mew=2.0, color="red",   linestyle="none", label="hxr flare")
 
-    # true hpc tick labels via sampling along mid row/col
+    # true hpc tick labels via the affine map along mid row/col
     xticks = [t for t in ax.get_xticks() if 0 <= t <= nx-1]
     yticks = [t for t in ax.get_yticks() if 0 <= t <= ny-1]
     ax.set_xticks(xticks); ax.set_yticks(yticks)
     def _fmt(v): return f"{v:.0f}″"
-    xlabels, ylabels = [], []
-    for xt in xticks:
-        c_icrs = w2d.pixel_to_world(np.asarray(xt), np.asarray(ny/2)).icrs
-        c_hpc  = SkyCoord(c_icrs.ra, c_icrs.dec, frame="icrs", obstime=obstime, distance=dist).transform_to(hpc_earth)
-        xlabels.append(_fmt(float(c_hpc.Tx.to_value(u.arcsec))))
-    for yt in yticks:
-        c_icrs = w2d.pixel_to_world(np.asarray(nx/2), np.asarray(yt)).icrs
-        c_hpc  = SkyCoord(c_icrs.ra, c_icrs.dec, frame="icrs", obstime=obstime, distance=dist).transform_to(hpc_earth)
-        ylabels.append(_fmt(float(c_hpc.Ty.to_value(u.arcsec))))
-    ax.set_xticklabels(xlabels); ax.set_yticklabels(ylabels)
+    ax.set_xticklabels([_fmt(v) for v in _pix_to_hpc(xticks, np.full(len(xticks), ny/2))[0]])
+    ax.set_yticklabels([_fmt(v) for v in _pix_to_hpc(np.full(len(yticks), nx/2), yticks)[1]])
     ax.set_xlabel("helioprojective longitude (solar-x) [arcsec]")
     ax.set_ylabel("helioprojective latitude (solar-y) [arcsec]")
 
@@ -3,16 +3,15 @@ matches STIX flares with MWA observations based on time overlap during local day
 STIX flare data from https://github.com/hayesla/stix_flarelist_science
 """
 import os
+import json
+import time
+from pathlib import Path
 import pandas as pd
 import pytz
 import pyvo
-from datetime import timedelta, time as dt_time
+from datetime import date, timedelta
 from astral import LocationInfo
 from astral.sun import sun
-from sunpy.coordinates.sun import earth_distance
-from sunpy.time import parse_time
-import astropy.units as u
-from astropy.constants import c
 import logging
 import numpy as np
 
@@ -38,14 +37,31 @@ def main():
     # decide output file name
     save_path = '../files/flares_recorded_by_mwa_test.csv'
 
+    # list columns as json so readers can json.loads them instead of ast.literal_eval
+    for col in LIST_COLUMNS:
+        flares_df[col] = flares_df[col].map(json.dumps)
     flares_df.to_csv(save_path, index=False)
     print_summary(num_samples)
 
 
-def load_and_preprocess_mwa_metadata(save: bool = False, path_to_save: str = "../files") -> pd.DataFrame:
+LIST_COLUMNS = [
+    'projectids', 'obs_ids', 'obs_names',
+    'calibrator_obs_ids', 'calibrator_obs_names', 'calibrator_time_diff_hr'
+]
+
+
+def load_and_preprocess_mwa_metadata(save: bool = False, path_to_save: str = "../files",
+                                     cache_ttl_hours: float = 6.0) -> pd.DataFrame:
     """
     loads mwa metadata via tap and pre‑processes datetime fields and calibration flags
+    the pre-processed table is cached as parquet in path_to_save; reruns within
+    cache_ttl_hours read the cache and skip the tap query (0 disables the cache)
     """
+    cache_path = Path(path_to_save) / "mwa_metadata.parquet"
+    if cache_ttl_hours > 0 and cache_path.exists() and \
+            time.time() - cache_path.stat().st_mtime < cache_ttl_hours * 3600:
+        return pd.read_parquet(cache_path)
+
     tap_service = pyvo.dal.TAPService("http://vo.mwatelescope.org/mwa_asvo/tap")
 
     query = """
@@ -60,9 +76,7 @@ def load_and_preprocess_mwa_metadata(save: bool = False, path_to_save: str = "..
 
     # make sure datetime columns are timezone aware (utc)
     for col in ['starttime_utc', 'stoptime_utc']:
-        mwa[col] = pd.to_datetime(mwa[col]).apply(
-            lambda x: x.tz_convert('UTC') if x.tzinfo else x.tz_localize('UTC')
-        )
+        mwa[col] = pd.to_datetime(mwa[col], utc=True)
 
     # normalise calibration column to boolean
     if 'calibration' in mwa.columns:
@@ -79,6 +93,13 @@ def load_and_preprocess_mwa_metadata(save: bool = False, path_to_save: str = "..
     if save:
         mwa.to_csv(os.path.join(path_to_save, "mwa_metadata.csv"), index=False)
 
+    if cache_ttl_hours > 0:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            mwa.to_parquet(cache_path, index=False, compression='zstd')
+        except (OSError, ValueError, TypeError, ImportError) as e:
+            logging.warning(f"could not write mwa metadata cache {cache_path}: {e}")
+
     return mwa
 
 
@@ -88,8 +109,8 @@ def load_and_preprocess_stix_data(filepath: str) -> pd.DataFrame:
     """
 
     stix = pd.read_csv(filepath)
-    stix['start_utc'] = pd.to_datetime(stix['start_UTC']).dt.tz_localize('UTC')
-    stix['end_utc'] = pd.to_datetime(stix['end_UTC']).dt.tz_localize('UTC')
+    stix['start_utc'] = pd.to_datetime(stix['start_UTC'], utc=True)
+    stix['end_utc'] = pd.to_datetime(stix['end_UTC'], utc=True)
     stix = stix[stix['visible_from_earth']].reset_index(drop=True)
     stix['flare_duration_sec'] = (stix['end_utc'] - stix['start_utc']).dt.total_seconds()
 
@@ -115,73 +136,161 @@ def analyze_and_filter_flares(stix_data: pd.DataFrame, mwa_data: pd.DataFrame, m
 
 def analyze_flare_data(stix: pd.DataFrame, mwa_data: pd.DataFrame, mwa_location: LocationInfo):
     """
-    loops through flares and calculates time overlap with mwa observations during daylight
+    calculates time overlap of all flares with mwa observations during daylight in one
+    vectorized interval join
     """
 
-    time_overlap_data = []
     num_samples = {f'matching {i*10}-{(i+1)*10}%': 0 for i in range(10)}
-    num_samples['num_of_matching_observations'] = 0
 
-    for _, flare_row in stix.iterrows():
-        flare_start, flare_end = flare_row['start_utc'], flare_row['end_utc']
-        flare_duration = flare_row['flare_duration_sec']
+    obs_index = build_obs_interval_index(mwa_data)
+    flare_start_ns = to_utc_ns(stix['start_utc'])
+    flare_end_ns = to_utc_ns(stix['end_utc'])
+    flare_duration = stix['flare_duration_sec'].to_numpy(dtype=float)
+
+    daylight = build_daylight_table(mwa_location, flare_start_ns, flare_end_ns)
+
+    overlap_sec = calculate_overlap(mwa_data, obs_index, flare_start_ns, flare_end_ns, daylight)
+    overlap_percentage = np.zeros(len(stix), dtype=np.int64)
+    valid = flare_duration > 0
+    overlap_percentage[valid] = (100 * overlap_sec[valid] / flare_duration[valid]).astype(np.int64)
 
-        overlap = calculate_overlap(mwa_data, flare_start, flare_end, mwa_location)
-        overlap_percentage = int(100 * overlap.total_seconds() / flare_duration)
+    time_overlap_data = pd.DataFrame({
+        'flare_id': stix['flare_id'],
+        'GOES_class': stix['GOES_class_time_of_flare'],
+        'start_UTC': stix['start_utc'],
+        'end_UTC': stix['end_utc'],
+        'flare_duration_sec': flare_duration.astype(np.int64),
+        'overlap_duration_sec': overlap_sec.astype(np.int64),
+        'overlap_percentage': overlap_percentage
+    })
 
-        time_overlap_data.append({
-            'flare_id': flare_row['flare_id'],
-            'GOES_class': flare_row['GOES_class_time_of_flare'],
-            'start_UTC': flare_row['start_utc'],
-            'end_UTC': flare_row['end_utc'],
-            'flare_duration_sec': int(flare_duration),
-            'overlap_duration_sec': int(overlap.total_seconds()),
-            'overlap_percentage': overlap_percentage
-        })
+    # bucket i holds i*10 < p <= (i+1)*10; p == 0 falls in no bucket, p > 100 neither
+    matched = overlap_percentage[(overlap_percentage > 0) & (overlap_percentage <= 100)]
+    buckets = np.bincount((matched - 1) // 10, minlength=10)
+    for i in range(10):
+        num_samples[f'matching {i*10}-{(i+1)*10}%'] = int(buckets[i])
+    num_samples['num_of_matching_observations'] = int((overlap_percentage > 0).sum())
 
-        if overlap_percentage > 0:
-            num_samples['num_of_matching_observations'] += 1
-        for i in range(10):
-            if i * 10 < overlap_percentage <= (i + 1) * 10:
-                num_samples[f'matching {i*10}-{(i+1)*10}%'] += 1
+    return time_overlap_data, num_samples
 
-    return pd.DataFrame(time_overlap_data), num_samples
+
+def to_utc_ns(values) -> np.ndarray:
+    """
+    int64 nanoseconds since epoch (utc) for a datetime column
+    """
+    return pd.DatetimeIndex(pd.to_datetime(values, utc=True)).as_unit('ns').asi8
+
+
+def build_obs_interval_index(mwa_data: pd.DataFrame) -> dict:
+    """
+    builds a sorted interval index over mwa observations (start, stop) in int64 ns
+    a query binary-searches the sorted starts, bounded below by the longest observation,
+    so only observations that can overlap are ever touched
+    """
+    start = to_utc_ns(mwa_data['starttime_utc'])
+    stop = to_utc_ns(mwa_data['stoptime_utc'])
+    order = np.argsort(start, kind='stable')
+    return {
+        'start': start[order],
+        'stop': stop[order],
+        'row': order,
+        'max_duration': int((stop - start).max()) if len(start) else 0,
+    }
+
+
+def match_flares_to_obs(obs_index: dict, start_ns: np.ndarray, end_ns: np.ndarray):
+    """
+    vectorized interval join of many query intervals against the observation index
+    returns (query_idx, pos) for every pair with obs start <= end_ns and obs stop >= start_ns,
+    pos indexing the sorted arrays of obs_index (obs_index['row'][pos] gives mwa_data rows)
+    """
+    lo = np.searchsorted(obs_index['start'], start_ns - obs_index['max_duration'], side='left')
+    hi = np.searchsorted(obs_index['start'], end_ns, side='right')
+    query_idx, pos = expand_ranges(lo, hi)
+    keep = obs_index['stop'][pos] >= start_ns[query_idx]
+    return query_idx[keep], pos[keep]
 
 
-def calculate_overlap(mwa_data: pd.DataFrame, flare_start, flare_end, mwa_location: LocationInfo):
+def expand_ranges(lo: np.ndarray, hi: np.ndarray):
     """
-    returns total time overlap (timedelta) between flare and mwa observations during local daylight
+    flattens per-query index ranges [lo[i], hi[i]) into (query_idx, pos) pair arrays
     """
-    mwa_relevant = mwa_data[
-        (mwa_data['starttime_utc'] <= flare_end) &
-        (mwa_data['stoptime_utc'] >= flare_start)
-    ]
+    counts = np.maximum(hi - lo, 0)
+    query_idx = np.repeat(np.arange(len(lo)), counts)
+    # lo[i], lo[i]+1, ..., hi[i]-1 for every query, concatenated
+    pos = np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    return query_idx, pos
 
-    if not mwa_relevant.empty:
-        times = mwa_relevant[['starttime_utc', 'stoptime_utc']]
-        print(f"{flare_start} - {flare_end} overlaps with {times} mwa observations")
 
-    total_overlap = timedelta(seconds=0)
+NS_PER_DAY = 86_400 * 10**9
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
 
-    for _, mwa_row in mwa_relevant.iterrows():
-        overlap_start = max(flare_start, mwa_row['starttime_utc'])
-        overlap_end = min(flare_end, mwa_row['stoptime_utc'])
 
-        # daylight window for the given date in utc
-        times = sun(mwa_location.observer, date=overlap_start.date(), tzinfo=pytz.UTC)
-        sunrise, sunset = times['sunrise'], times['sunset']
+def build_daylight_table(mwa_location: LocationInfo, start_ns: np.ndarray, end_ns: np.ndarray) -> dict:
+    """
+    sunrise/sunset [int64 ns, utc] for every utc date spanned by the given intervals,
+    computed once per date; returns {'first_ordinal', 'sunrise', 'sunset'} where the
+    arrays are indexed by date.toordinal() - first_ordinal
+    """
+    if len(start_ns) == 0:
+        return {'first_ordinal': EPOCH_ORDINAL, 'sunrise': np.zeros(0, np.int64), 'sunset': np.zeros(0, np.int64)}
+    first = int(start_ns.min() // NS_PER_DAY) + EPOCH_ORDINAL
+    last = int(end_ns.max() // NS_PER_DAY) + EPOCH_ORDINAL + 1
+    sunrise, sunset = [], []
+    for ordinal in range(first, last + 1):
+        times = sun(mwa_location.observer, date=date.fromordinal(ordinal), tzinfo=pytz.UTC)
+        sunrise.append(pd.Timestamp(times['sunrise']).value)
+        sunset.append(pd.Timestamp(times['sunset']).value)
+    return {'first_ordinal': first,
+            'sunrise': np.array(sunrise, dtype=np.int64), 'sunset': np.array(sunset, dtype=np.int64)}
+
+
+def daylight_window(daylight: dict, t_ns: np.ndarray):
+    """
+    (sunrise, sunset) [int64 ns] bracketing each time, looked up from the daylight table
+    handles wrap‑around for observations crossing midnight: mwa daylight spans the utc
+    date boundary, so mornings (utc) pair with the previous sunrise and evenings with
+    the next sunset
+    """
+    day = t_ns // NS_PER_DAY
+    tod = t_ns - day * NS_PER_DAY
+    idx = day + EPOCH_ORDINAL - daylight['first_ordinal']
+    sunrise = daylight['sunrise'][idx]
+    sunset = daylight['sunset'][idx]
+    hour = 3_600 * 10**9
+    # fancy indexing above already copied, so shift in place
+    np.subtract(sunrise, NS_PER_DAY, out=sunrise, where=tod < 12 * hour)
+    np.add(sunset, NS_PER_DAY, out=sunset, where=tod >= 17 * hour)
+    return sunrise, sunset
+
+
+def calculate_overlap(mwa_data: pd.DataFrame, obs_index: dict, flare_start_ns: np.ndarray,
+                      flare_end_ns: np.ndarray, daylight: dict) -> np.ndarray:
+    """
+    returns total time overlap [s] per flare between flares and mwa observations during local daylight
+    obs_index is the interval index from build_obs_interval_index(mwa_data), daylight the
+    per-date sunrise/sunset table from build_daylight_table
+    """
+    flare_idx, pos = match_flares_to_obs(obs_index, flare_start_ns, flare_end_ns)
 
-        # handle wrap‑around for observations crossing midnight
-        adjusted_sunrise = sunrise - timedelta(days=1) if dt_time(0, 0) <= overlap_start.time() < dt_time(12, 0) else sunrise
-        adjusted_sunset = sunset + timedelta(days=1) if dt_time(17, 0) <= overlap_start.time() <= dt_time(23, 59) else sunset
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        flares, counts = np.unique(flare_idx, return_counts=True)
+        for i, n in zip(flares, counts):
+            logging.debug("flare %s - %s overlaps with %d mwa observations",
+                          pd.Timestamp(flare_start_ns[i], tz='UTC'), pd.Timestamp(flare_end_ns[i], tz='UTC'), n)
 
-        total_overlap_start = overlap_start
-        total_overlap_end = overlap_end
+    overlap_start = np.maximum(flare_start_ns[flare_idx], obs_index['start'][pos])
+    overlap_end = np.minimum(flare_end_ns[flare_idx], obs_index['stop'][pos])
 
-        if total_overlap_start < total_overlap_end:
-            total_overlap += total_overlap_end - total_overlap_start
+    # clip each flare/observation overlap to the daylight window of its date in utc,
+    # reusing the pair-sized buffers instead of allocating a temporary per step
+    sunrise, sunset = daylight_window(daylight, overlap_start)
+    np.minimum(overlap_end, sunset, out=overlap_end)
+    np.maximum(overlap_start, sunrise, out=overlap_start)
+    overlap_ns = np.subtract(overlap_end, overlap_start, out=overlap_end)
+    np.maximum(overlap_ns, 0, out=overlap_ns)
 
-    return total_overlap
+    return np.bincount(flare_idx, weights=overlap_ns, minlength=len(flare_start_ns)) / 1e9
 
 
 def find_flares_with_overlap(df: pd.DataFrame, overlap_percentage: int):
@@ -198,73 +307,76 @@ def sort(df: pd.DataFrame, sort_values_list=None):
     if sort_values_list is None:
         sort_values_list = ['overlap_percentage', 'goes_numeric']
 
-    df['goes_numeric'] = df['GOES_class'].apply(goes_class_to_numeric)
+    df['goes_numeric'] = goes_class_to_numeric(df['GOES_class'])
     return df.sort_values(by=sort_values_list, ascending=[False, False], ignore_index=True)
 
 
-def goes_class_to_numeric(goes_class: str):
+GOES_SCALE = {'A': 1e-8, 'B': 1e-7, 'C': 1e-6, 'M': 1e-5, 'X': 1e-4}
+
+
+def goes_class_to_numeric(goes_class: pd.Series) -> pd.Series:
     """
-    converts goes class (e.g. m5.6) to a numeric proxy for sorting
+    converts goes classes (e.g. m5.6) to a numeric proxy for sorting, -1 where unparsable
     """
-    if pd.isna(goes_class):
-        return -1
-
-    scale = {'A': 1e-8, 'B': 1e-7, 'C': 1e-6, 'M': 1e-5, 'X': 1e-4}
-    try:
-        prefix = goes_class[0].upper()
-        magnitude = float(goes_class[1:]) if len(goes_class) > 1 else 1.0
-        return scale[prefix] * magnitude
-    except (KeyError, ValueError):
-        return -1
+    goes_class = goes_class.astype(str)   # nan/None become 'nan'/'None' and fail the prefix lookup
+    scale = goes_class.str[0].str.upper().map(GOES_SCALE)
+    tail = goes_class.str[1:]
+    magnitude = pd.to_numeric(tail, errors='coerce').mask(tail.str.len() == 0, 1.0)
+    return (scale * magnitude).fillna(-1.0)
 
 
 def attach_mwa_and_calibrator_info(flares_df: pd.DataFrame, mwa_data: pd.DataFrame) -> pd.DataFrame:
     """
     enriches each flare with matching mwa observation ids, names, and nearby calibrator info (<12 h)
     """
-    # prepare empty list columns
-    extra_cols = [
-        'projectids',
-        'obs_ids',
-        'obs_names',
-        'calibrator_obs_ids',
-        'calibrator_obs_names',
-        'calibrator_time_diff_hr'
-    ]
-    for col in extra_cols:
-        flares_df[col] = [[] for _ in range(len(flares_df))]
-
-    twelve_hours = timedelta(hours=12)
-
-    for idx, row in flares_df.iterrows():
-        flare_start = pd.to_datetime(row['start_UTC'])
-        flare_end = pd.to_datetime(row['end_UTC'])
-
-        # observations overlapping the flare
-        matching_data = mwa_data[(mwa_data['starttime_utc'] <= flare_end) & (mwa_data['stoptime_utc'] >= flare_start)]
-        if matching_data.empty:
-            continue
-
-        # basic observation information
-        flares_df.at[idx, 'projectids'] = matching_data['projectid'].tolist()
-        flares_df.at[idx, 'obs_ids'] = matching_data['obs_id'].tolist()
-        flares_df.at[idx, 'obs_names'] = matching_data['obsname'].tolist()
-
-        # pick the first observation as reference to locate calibrators
-        reference_time = matching_data.iloc[0]['starttime_utc']
-
-        # find calibrator observations within ±12 h of the reference
-        calibrator_mask = (
-            (mwa_data['calibration']) &
-            (abs((mwa_data['starttime_utc'] - reference_time).dt.total_seconds()) <= twelve_hours.total_seconds())
-        )
-        calibrator_data = mwa_data[calibrator_mask]
-
-        if not calibrator_data.empty:
-            flares_df.at[idx, 'calibrator_obs_ids'] = calibrator_data['obs_id'].tolist()
-            flares_df.at[idx, 'calibrator_obs_names'] = calibrator_data['obsname'].tolist()
-            time_deltas = [round(abs((t - reference_time).total_seconds()) / 3600, 2) for t in calibrator_data['starttime_utc']]
-            flares_df.at[idx, 'calibrator_time_diff_hr'] = time_deltas
+    twelve_hours_ns = int(timedelta(hours=12).total_seconds()) * 10**9
+    n = len(flares_df)
+
+    # observations overlapping each flare as one (flare, obs row) pair table, in mwa_data order
+    obs_index = build_obs_interval_index(mwa_data)
+    flare_idx, pos = match_flares_to_obs(obs_index, to_utc_ns(flares_df['start_UTC']), to_utc_ns(flares_df['end_UTC']))
+    rows = obs_index['row'][pos]
+    order = np.lexsort((rows, flare_idx))
+    flare_idx, rows = flare_idx[order], rows[order]
+
+    # basic observation information
+    pairs = mwa_data[['projectid', 'obs_id', 'obsname']].iloc[rows].reset_index(drop=True)
+    pairs['flare_idx'] = flare_idx
+    obs_lists = pairs.groupby('flare_idx').agg(
+        projectids=('projectid', pd.Series.tolist), obs_ids=('obs_id', pd.Series.tolist), obs_names=('obsname', pd.Series.tolist)
+    )
+
+    # pick the first observation as reference to locate calibrators
+    matched, first = np.unique(flare_idx, return_index=True)
+    obs_start_ns = to_utc_ns(mwa_data['starttime_utc'])
+    reference_ns = obs_start_ns[rows[first]]
+
+    # find calibrator observations within ±12 h of the reference by binary search on sorted starts
+    cal_rows = np.flatnonzero(mwa_data['calibration'].to_numpy(dtype=bool))
+    cal_rows = cal_rows[np.argsort(obs_start_ns[cal_rows], kind='stable')]
+    cal_start_ns = obs_start_ns[cal_rows]
+    lo = np.searchsorted(cal_start_ns, reference_ns - twelve_hours_ns, side='left')
+    hi = np.searchsorted(cal_start_ns, reference_ns + twelve_hours_ns, side='right')
+    ref_idx, cal_pos = expand_ranges(lo, hi)
+    crow = cal_rows[cal_pos]
+    order = np.lexsort((crow, ref_idx))
+    ref_idx, crow = ref_idx[order], crow[order]
+
+    cal_pairs = mwa_data[['obs_id', 'obsname']].iloc[crow].reset_index(drop=True)
+    cal_pairs['flare_idx'] = matched[ref_idx]
+    cal_pairs['time_diff_hr'] = np.round(np.abs(obs_start_ns[crow] - reference_ns[ref_idx]) / 3.6e12, 2)
+    cal_lists = cal_pairs.groupby('flare_idx').agg(
+        calibrator_obs_ids=('obs_id', pd.Series.tolist), calibrator_obs_names=('obsname', pd.Series.tolist),
+        calibrator_time_diff_hr=('time_diff_hr', pd.Series.tolist)
+    )
+
+    # one left join of both aggregates onto all flares; flares without entries get fresh []
+    per_flare = obs_lists.join(cal_lists, how='outer').reindex(range(n))
+    for col in per_flare.columns:
+        values = per_flare[col].to_numpy(dtype=object)
+        for i in np.flatnonzero(per_flare[col].isna().to_numpy()):
+            values[i] = []
+        flares_df[col] = values
 
     return flares_df
 
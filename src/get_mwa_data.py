@@ -1,8 +1,8 @@
 import os
-import re
 import ast
-import glob
+import json
 import pandas as pd
+from functools import lru_cache
 from pathlib import Path
 from typing import List
 import find_flares_in_mwa
@@ -14,6 +14,9 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 root_path_to_data = get_root_path_to_data()
 
+# default obs ids for main(); leave empty to use the flare list instead
+DEFAULT_OBSERVATION_IDS = (1403258056, 1387107440, 1401789256)
+
 def main():
     """
     download mwa data based on provided observation ids or flares matched with mwa metadata.
@@ -29,7 +32,7 @@ def main():
     download_data = True
     if download_data:
         files_path = "../files"
-        observation_ids = [1403258056, 1387107440, 1401789256]  # leave empty to use flare list below
+        observation_ids = list(DEFAULT_OBSERVATION_IDS)
 
         job_info = {
             'job_type': 'c',    # 'c' for .ms data download, 'v' for voltage (raw data), 'm' for metadata
@@ -51,7 +54,7 @@ def download_by_obs_ids(observations, job_info):
     """
     downloads mwa data using a manual list of observation ids
     """
-    download_mwa_data(observations, job_info)
+    download_mwa_data(observations, job_info, downloaded_obs=get_downloaded_obs_info(root_path_to_data))
 
 
 def download_by_flare_overlap(filename, files_path, job_info, flare_range=None):
@@ -65,31 +68,56 @@ def download_by_flare_overlap(filename, files_path, job_info, flare_range=None):
     if not os.path.exists(flarelist_path):
         find_flares_in_mwa.main()
 
-    flare_data = pd.read_csv(flarelist_path)
+    # only parse the requested rows (the header is line 0)
+    if flare_range:
+        start, stop = flare_range
+        flare_data = pd.read_csv(flarelist_path, skiprows=range(1, start + 1), nrows=stop - start)
+    else:
+        flare_data = pd.read_csv(flarelist_path)
 
-    for i, row in flare_data.iterrows():
-        if flare_range is None or (flare_range[0] <= i < flare_range[1]):
-            download_mwa_data(row, job_info, is_flare_row=True)
+    # only these two columns are used per flare; iterate them as plain arrays
+    obs_col = flare_data['obs_ids'].map(parse_list_cell).to_numpy()
+    flare_col = flare_data['flare_id'].to_numpy() if 'flare_id' in flare_data else ['unknown'] * len(obs_col)
 
+    # scan the data dir once, then submit the new obs of all flares as one asvo batch
+    # (one login and one notifier for the whole range instead of one per flare)
+    downloaded_obs = get_downloaded_obs_info(root_path_to_data)
+    pending = {}
+    for obs_ids, flare_id in zip(obs_col, flare_col):
+        new_obs_ids = [obs_id for obs_id in obs_ids if obs_id not in downloaded_obs]
+        if new_obs_ids:
+            logging.info(f"Flare {flare_id}: {len(new_obs_ids)} observations to download.")
+            pending.update(dict.fromkeys(new_obs_ids))
+        else:
+            logging.info(f"All observations for flare {flare_id} have already been downloaded.")
 
-def download_mwa_data(obs_source, job_info, is_flare_row=False):
+    if pending:
+        download_mwa_data(list(pending), job_info, downloaded_obs=downloaded_obs)
+
+
+def download_mwa_data(obs_source, job_info, is_flare_row=False, downloaded_obs=None):
     """
     downloads mwa data based on observation ids or flare row
     - obs_source: list of obs_ids or a flare row with 'obs_ids' field
     - avg_time_res: time averaging resolution
     - avg_freq_res: frequency averaging resolution
     - is_flare_row: set to True if passing a flare row
+    - downloaded_obs: set of already downloaded obs ids (scanned from the data dir if None);
+      updated in place after a successful download
     """
     
     if is_flare_row:
-        obs_ids = ast.literal_eval(obs_source['obs_ids'])
+        obs_ids = obs_source['obs_ids']
+        if isinstance(obs_ids, str):
+            obs_ids = parse_list_cell(obs_ids)
         flare_id = obs_source.get('flare_id', 'unknown')
     else:
         obs_ids = obs_source
         flare_id = None
 
      # download only new observations, or same observations if size differs
-    downloaded_obs = get_downloaded_obs_info(root_path_to_data)
+    if downloaded_obs is None:
+        downloaded_obs = get_downloaded_obs_info(root_path_to_data)
     new_obs_ids = [obs_id for obs_id in obs_ids if obs_id not in downloaded_obs]
 
     if not new_obs_ids:
@@ -107,24 +135,36 @@ def download_mwa_data(obs_source, job_info, is_flare_row=False):
             logging.info(f"Submitting {len(jobs_to_submit)} jobs for flare {flare_id}.")
         else:
             logging.info(f"Submitting {len(jobs_to_submit)} jobs for observations {new_obs_ids}.")
-        process_jobs(jobs_to_submit)
+        if process_jobs(jobs_to_submit):
+            downloaded_obs.update(int(obs_id) for obs_id in new_obs_ids)
 
 
-def get_downloaded_obs_info(root_path: str | Path):
+def parse_list_cell(cell: str) -> list:
     """
-    Collect observation IDs and their file sizes from files only, ignoring subfolders.
-    Returns a dictionary mapping obs_id -> file size in bytes.
+    parse a list column written by find_flares_in_mwa (json); falls back to
+    ast.literal_eval for flare lists written before the json format
     """
-    downloaded_obs = []
-    root = Path(root_path)
+    try:
+        return json.loads(cell)
+    except ValueError:
+        return ast.literal_eval(cell)
 
-    for entry in root.iterdir():
-        if not entry.is_file():
-            continue
 
-        prefix = entry.name.split("_", 1)[0]
-        if prefix.isdigit():
-            downloaded_obs.append(int(prefix))
+def get_downloaded_obs_info(root_path: str | Path) -> set[int]:
+    """
+    Collect observation IDs from files only, ignoring subfolders.
+    Returns a set of obs ids; uses os.scandir so the file type comes from the
+    directory entry without an extra stat per file.
+    """
+    downloaded_obs = set()
+    with os.scandir(root_path) as it:
+        for entry in it:
+            name = entry.name
+            cut = name.find("_")
+            prefix = name[:cut] if cut != -1 else name
+            # isascii first: int() rejects non-ascii digits that isdigit() accepts
+            if prefix.isascii() and prefix.isdigit() and entry.is_file():
+                downloaded_obs.add(int(prefix))
 
     return downloaded_obs
 
@@ -135,52 +175,85 @@ def ensure_metafits(ms_root: Path = root_path_to_data) -> None:
     downloads any missing ones using your downloader with job_type='m'.
     """
     ms_root.mkdir(parents=True, exist_ok=True)
+
+    # skip the scan if nothing was added/removed since the last clean check
+    state = ms_root / ".metafits_lastcheck"
+    cur_mtime = ms_root.stat().st_mtime_ns
+    try:
+        if int(state.read_text()) == cur_mtime:
+            logging.info("no changes in %s since last metafits check.", ms_root)
+            return
+    except (OSError, ValueError):
+        pass
+
     missing = collect_missing_metafits_obsids(ms_root)
     if not missing:
         logging.info("no missing metafits detected.")
+        state.write_text(str(ms_root.stat().st_mtime_ns))
         return
     logging.info("downloading %d missing metafits…", len(missing))
     download_by_obs_ids(missing, job_info={'job_type': 'm'})
 
 
-_MS_RE = re.compile(r"^(?P<obs>\d{9,12})_\d+_ms\.tar$")  # handles 9–12 digit obs ids
 def _extract_obs_id(filename: str) -> str | None:
     """
-    pull obs id from names like '1126847624_846700_ms.tar'
+    pull obs id from names like '1126847624_846700_ms.tar' (9–12 digit obs ids)
+    plain string checks, no regex in the directory scan loop
     """
-    m = _MS_RE.match(filename)
-    return m.group("obs") if m else None
+    if not filename.endswith("_ms.tar"):
+        return None
+    obs, sep, job = filename[:-7].partition("_")
+    if sep and 9 <= len(obs) <= 12 and obs.isdecimal() and job.isdecimal():
+        return obs
+    return None
 
 
-def collect_obs_ids_from_ms(ms_root: Path = root_path_to_data) -> List[str]:
+def _scan_ms_root(ms_root: Path) -> tuple[frozenset[str], frozenset[str]]:
     """
-    list all unique obs ids present as '*_ms.tar' under ms_root (non recursive).
+    one directory pass over ms_root (non recursive): obs ids with a '*_ms.tar' and
+    obs ids with a '*_vis_meta.tar'
+    cached on the directory mtime, so repeated checks reuse the index until a tar is
+    added or removed
     """
-    obs_ids: set[str] = set()
-    for path in ms_root.glob("*_ms.tar"):
-        obs = _extract_obs_id(path.name)
-        if obs:
-            obs_ids.add(obs)
-        else:
-            logging.debug("skipping non-matching file: %s", path.name)
-    return sorted(obs_ids)
+    return _index_ms_root(str(ms_root), os.stat(ms_root).st_mtime_ns)
+
+
+@lru_cache(maxsize=1)
+def _index_ms_root(ms_root: str, mtime_ns: int) -> tuple[frozenset[str], frozenset[str]]:
+    ms_ids: set[str] = set()
+    meta_ids: set[str] = set()
+    with os.scandir(ms_root) as it:
+        for entry in it:
+            name = entry.name
+            if name.endswith("_ms.tar"):
+                if not entry.is_file():
+                    continue
+                obs = _extract_obs_id(name)
+                if obs:
+                    ms_ids.add(obs)
+                else:
+                    logging.debug("skipping non-matching file: %s", name)
+            elif name.endswith("_vis_meta.tar") and entry.is_file():
+                meta_ids.add(name.split("_", 1)[0])
+    return frozenset(ms_ids), frozenset(meta_ids)
 
 
-def metafits_exists(obs_id: str, ms_root: Path = root_path_to_data) -> bool:
+def collect_obs_ids_from_ms(ms_root: Path = root_path_to_data) -> List[str]:
     """
-    check if there is at least one metafits tar like 'obsid_*_vis_meta.tar'
+    list all unique obs ids present as '*_ms.tar' under ms_root (non recursive).
     """
-    pattern = str(ms_root / f"{obs_id}_*_vis_meta.tar")
-    return len(glob.glob(pattern)) > 0
+    ms_ids, _ = _scan_ms_root(ms_root)
+    return sorted(ms_ids)
 
 
 def collect_missing_metafits_obsids(ms_root: Path = root_path_to_data) -> List[str]:
     """
-    return obs ids that have ms tar present but no corresponding metafits tar.
+    return obs ids that have ms tar present but no corresponding metafits tar
+    like 'obsid_*_vis_meta.tar'.
     """
-    obs_ids = collect_obs_ids_from_ms(ms_root)
-    missing = [obs for obs in obs_ids if not metafits_exists(obs, ms_root)]
-    logging.info("found %d obs ids, %d missing metafits", len(obs_ids), len(missing))
+    ms_ids, meta_ids = _scan_ms_root(ms_root)
+    missing = sorted(ms_ids - meta_ids)
+    logging.info("found %d obs ids, %d missing metafits", len(ms_ids), len(missing))
     if missing:
         logging.info("missing metafits for obs ids: %s", ", ".join(missing))
     return missing
@@ -12,7 +12,14 @@ except:
 
 from websocket import create_connection, WebSocketConnectionClosedException, WebSocketTimeoutException
 from requests.auth import HTTPBasicAuth
-import pkg_resources  # part of setuptools
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from importlib.metadata import version as _package_version
+from helper_functions.utils import _fadvise
+
+
+# resolved once at import instead of per call
+_VERSION = _package_version("mantaray-client")  # format major.minor.revision
 
 
 def get_api_version_number():
@@ -21,13 +28,12 @@ def get_api_version_number():
     """
     
     # this is what we send to the server when we confirm version compatibility.
-    version = pkg_resources.require("mantaray-client")[0].version  # format major.minor.revision
-    version_parts = version.split(".")
+    version_parts = _VERSION.split(".")
     return "mantaray-clientv{0}.{1}".format(version_parts[0], version_parts[1])
 
 
 def get_version_number():
-    return pkg_resources.require("mantaray-client")[0].version
+    return _VERSION
 
 
 def get_pretty_version_string():
@@ -36,16 +42,21 @@ def get_pretty_version_string():
 
 """
 notify wrapper around /api/job_results.
-keeps the websocket alive with pings and can reconnect automatically.
+reconnects automatically when the websocket drops.
 """
 
-import json, ssl, time, threading
+import json, ssl, time
 from websocket import (
     create_connection,
     WebSocketConnectionClosedException,
     WebSocketTimeoutException,
 )
 
+try:
+    from orjson import loads as _loads   # optional, faster frame parsing
+except ImportError:
+    _loads = json.loads
+
 # ----------------------------------------------------------------------
 # notify
 # ----------------------------------------------------------------------
@@ -62,10 +73,12 @@ class Notify(object):
         session,             # Session wrapper (provides .session -> requests.Session)
         ws,                  # websocket-client connection
         *,
-        https, host, port, api_key, sslopt, ping_interval, autopings
+        https, host, port, api_key, sslopt, ping_interval, cookie_str, owns_session=True
     ):
         self._session = session
+        self._owns_session = owns_session    # False when borrowed from the caller
         self._ws = ws
+        self._cookie_str = cookie_str    # MWA_JOB_COOKIE header, reused for cheap reconnects
 
         # params needed for future reconnects
         self._https = https
@@ -74,12 +87,6 @@ class Notify(object):
         self._api_key = api_key
         self._sslopt = sslopt
         self._ping_interval = ping_interval
-        self._autopings = autopings
-
-        # manual ping loop for websocket-client < 1.0
-        self._ping_thread = None
-        if not autopings:
-            self._start_ping_thread()
 
     # context-manager sugar
     def __enter__(self): return self
@@ -89,23 +96,33 @@ class Notify(object):
         try:
             self._ws.close()
         finally:
-            self._session.close()
+            if self._owns_session:
+                self._session.close()
 
     # ------------------------------------------------------------------
     # public api
     # ------------------------------------------------------------------
-    def recv(self, retries: int = 3, backoff: int = 5) -> dict | None:
+    def recv(self, retries: int = 3, backoff: int = 5, accept=None) -> dict | None:
         """
         receive one json message; silently reconnect on socket drop.
+        accept: optional callable on the raw frame; frames it rejects are skipped
+        without being parsed (e.g. lambda f: '"job_state"' in f)
         returns None after exhausting retries.
         """
         for attempt in range(retries):
             try:
-                frame = self._ws.recv()
-                if frame:
-                    return json.loads(frame)
-                raise WebSocketConnectionClosedException()
-            except (WebSocketConnectionClosedException, WebSocketTimeoutException):
+                while True:
+                    try:
+                        frame = self._ws.recv()
+                    except WebSocketTimeoutException:
+                        # idle for ping_interval: send a keepalive and keep waiting
+                        self._ws.ping()
+                        continue
+                    if not frame:
+                        raise WebSocketConnectionClosedException()
+                    if accept is None or accept(frame):
+                        return _loads(frame)
+            except (WebSocketConnectionClosedException, WebSocketTimeoutException, OSError):
                 time.sleep(backoff * (attempt + 1))
                 if self._reconnect():
                     continue          # try receive again immediately
@@ -124,13 +141,18 @@ class Notify(object):
         *,
         sslopt: dict | None = None,
         ping_interval: int = 30,
+        session: "Session | None" = None,
     ) -> "Notify":
         """
         open websocket and return a ready notify object.
         https = "1" for https/wss, "0" for http/ws
+        pass an already logged-in session to skip the extra api_login round trip;
+        it stays owned (and is closed) by the caller
         """
         # 1. authenticated http session (gets MWA_JOB_COOKIE)
-        session = Session.login(https, host, port, api_key, verify=False)
+        owns_session = session is None
+        if owns_session:
+            session = Session.login(https, host, port, api_key, verify=False)
 
         # 2. cookie header (extract from the underlying requests.Session)
         cookie_jar = session.session.cookies
@@ -138,70 +160,74 @@ class Notify(object):
         if "MWA_JOB_COOKIE" not in cookie_str:
             raise RuntimeError("mwa_job_cookie missing after api_login")
 
-        # 3. open websocket, prefer built-in ping_interval if available
-        ws_scheme = "wss" if https == "1" else "ws"
-        ws_url = f"{ws_scheme}://{host}:{port}/api/job_results"
-
-        autopings = True
-        try:
-            ws = create_connection(
-                ws_url,
-                header={"Cookie": cookie_str},
-                sslopt=sslopt or {"cert_reqs": ssl.CERT_NONE},
-                ping_interval=ping_interval,
-                ping_timeout=10,
-            )
-        except TypeError:            # websocket-client < 1.0
-            autopings = False
-            ws = create_connection(
-                ws_url,
-                header={"Cookie": cookie_str},
-                sslopt=sslopt or {"cert_reqs": ssl.CERT_NONE},
-            )
+        # 3. open websocket
+        ws = cls._open_ws(https, host, port, cookie_str, sslopt, ping_interval)
 
         return cls(
             session, ws,
             https=https, host=host, port=port, api_key=api_key,
-            sslopt=sslopt, ping_interval=ping_interval, autopings=autopings
+            sslopt=sslopt, ping_interval=ping_interval,
+            cookie_str=cookie_str, owns_session=owns_session,
+        )
+
+    @staticmethod
+    def _open_ws(https, host, port, cookie_str, sslopt, ping_interval):
+        """
+        open the job_results websocket (websocket-client >= 1.0).
+        create_connection sends no pings itself; the socket timeout makes recv wake up
+        after ping_interval idle seconds so it can ping the server
+        """
+        ws_scheme = "wss" if https == "1" else "ws"
+        ws_url = f"{ws_scheme}://{host}:{port}/api/job_results"
+
+        return create_connection(
+            ws_url,
+            header={"Cookie": cookie_str},
+            sslopt=sslopt or {"cert_reqs": ssl.CERT_NONE},
+            timeout=ping_interval,
         )
 
     # ------------------------------------------------------------------
     # internal helpers
     # ------------------------------------------------------------------
+    def _reopen_ws(self) -> bool:
+        """reopen the websocket with the cached cookie (no new api login)."""
+        try:
+            ws = Notify._open_ws(
+                self._https, self._host, self._port, self._cookie_str,
+                self._sslopt, self._ping_interval,
+            )
+        except Exception:            # handshake refused (e.g. 401, cookie expired)
+            return False
+        try:
+            self._ws.close()
+        except Exception:
+            pass
+        self._ws = ws
+        return True
+
     def _reconnect(self) -> bool:
         """try to reopen the websocket; returns True on success."""
+        if self._reopen_ws():
+            return True
         try:
             new = Notify.login(
                 self._https, self._host, self._port, self._api_key,
                 sslopt=self._sslopt, ping_interval=self._ping_interval,
             )
             # swap objects
-            self._session.close()
+            if self._owns_session:
+                self._session.close()
             self._session, self._ws = new._session, new._ws
-            self._autopings = new._autopings
-            if not self._autopings:
-                self._start_ping_thread()
+            self._owns_session = True
+            self._cookie_str = new._cookie_str
             return True
         except Exception:
             return False
 
-    def _start_ping_thread(self):
-        """manual ping every self._ping_interval seconds."""
-        if self._ping_thread and self._ping_thread.is_alive():
-            return
-
-        def _ping():
-            while True:
-                time.sleep(self._ping_interval)
-                try:
-                    self._ws.ping()
-                except Exception:
-                    break
-
-        self._ping_thread = threading.Thread(target=_ping, daemon=True)
-        self._ping_thread.start()
-
 
+DOWNLOAD_POOL_SIZE = 32
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
 
 
 class Session(object):
@@ -240,6 +266,13 @@ class Session(object):
         requests.packages.urllib3.disable_warnings()
 
         session = requests.session()
+        # the download threads (one per job) share this session, so keep enough
+        # pooled connections for them to reuse instead of reconnecting per file
+        # retries cover connection errors and idempotent requests only (not job POSTs)
+        adapter = HTTPAdapter(pool_connections=DOWNLOAD_POOL_SIZE, pool_maxsize=DOWNLOAD_POOL_SIZE,
+                              max_retries=Retry(total=3, backoff_factor=0.5))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
         protocol = 'https' if https == '1' else 'http'
         url = "{0}://{1}:{2}/api/api_login".format(protocol, host, port)
         with session.post(url,
@@ -319,11 +352,27 @@ class Session(object):
                               url,
                               output_path):
 
-        with requests.get(url, stream=True, timeout=10) as r:
+        with self.session.get(url, stream=True, timeout=10) as r:
             r.raise_for_status()
 
             with open(output_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
+                # reserve the whole extent up front so the large sequential writes
+                # don't extend the file (and its metadata) chunk by chunk
+                size = int(r.headers.get('Content-Length') or 0)
+                if size and hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(f.fileno(), 0, size)
+                    except OSError:
+                        pass
+
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
                     f.write(chunk)
+                f.truncate()
+
+                # the tars are not reread soon, keep them from evicting the page cache;
+                # DONTNEED skips dirty pages, so write them back first
+                f.flush()
+                getattr(os, 'fdatasync', os.fsync)(f.fileno())
+                _fadvise(f.fileno(), 0, 0, 'POSIX_FADV_DONTNEED')
         
         return output_path
\ No newline at end of file
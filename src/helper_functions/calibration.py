@@ -1,19 +1,42 @@
 import subprocess, os, shutil, logging
+from functools import lru_cache
 from pathlib import Path
 import numpy as np
 from casacore.tables import table
-from helper_functions.utils import get_observation_path, ms_central_frequency
+from helper_functions.utils import get_observation_path, ms_central_frequency, mwa_tool_env
 
 log = logging.getLogger(__name__)
 
+# environment for every hyperdrive call, built once instead of per subprocess
+HYPERDRIVE_ENV = mwa_tool_env()
+
+
+def run_hyperdrive(subcommand: str, *args):
+    """
+    run one hyperdrive subcommand (e.g. 'di-calibrate', 'solutions-apply')
+    """
+    subprocess.run(["hyperdrive", subcommand, *map(str, args)], env=HYPERDRIVE_ENV, check=True)
+
+
+@lru_cache(maxsize=None)
+def _phase_dir(ms_path: str, mtime_ns: int) -> tuple[float, float]:
+    """
+    (ra, dec) [rad] of the first field; cached per ms and FIELD table mtime
+    """
+    fld = table(f"{ms_path}/FIELD", ack=False)
+    try:
+        ra_rad, dec_rad = fld.getcol("PHASE_DIR")[0, 0, :]
+    finally:
+        fld.close()
+    return float(ra_rad), float(dec_rad)
+
 
 def write_point_srclist(ms_path: Path, flux_jy: float, out_yaml: Path):
     """
     write a one-line yaml sky model at the ms phase centre
     """
-    fld = table(str(ms_path / "FIELD"))
-    ra_rad, dec_rad = fld.getcol("PHASE_DIR")[0, 0, :]
-    fld.close()
+    field = ms_path / "FIELD"
+    ra_rad, dec_rad = _phase_dir(str(ms_path), os.stat(field / "table.dat").st_mtime_ns)
     ra_deg, dec_deg = np.degrees([ra_rad, dec_rad])
     out_yaml.write_text(f"""
 calibrator:
@@ -35,13 +58,7 @@ def run_di_calibrate(cal_ms: Path, flux_jy: float, sol_path: Path, work_root):
     yaml_path = sol_path.with_suffix(".yaml")
     write_point_srclist(cal_ms, flux_jy, yaml_path)
 
-    subprocess.run(
-        ["hyperdrive", "di-calibrate",
-         "-d", str(cal_ms),
-         "-s", str(yaml_path),
-         "-o", str(sol_path)],
-        check=True
-    )
+    run_hyperdrive("di-calibrate", "-d", cal_ms, "-s", yaml_path, "-o", sol_path)
 
 
 def apply_solutions(raw_ms: Path, sol_path: Path, work_root) -> Path:
@@ -52,12 +69,6 @@ def apply_solutions(raw_ms: Path, sol_path: Path, work_root) -> Path:
     if out_ms.exists():
         shutil.rmtree(out_ms)
         
-    subprocess.run(
-        ["hyperdrive", "solutions-apply",
-         "-d", str(raw_ms),
-         "-s", str(sol_path),
-         "-o", str(out_ms)],
-        check=True
-    )
+    run_hyperdrive("solutions-apply", "-d", raw_ms, "-s", sol_path, "-o", out_ms)
     return out_ms
  
\ No newline at end of file
@@ -2,13 +2,28 @@ import os
 import logging
 import requests
 import numpy as np
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 from bs4 import BeautifulSoup
 from astropy.io import fits
+from astropy.time import Time, TimeDelta
 from datetime import timedelta
 from sunpy.time import parse_time
 import matplotlib.pyplot as plt
-from helper_functions.utils import set_x_ticks, safe_parse_time
+from helper_functions.utils import set_x_ticks, safe_parse_time, spectrogram_display
+
+try:
+    import fitsio  # optional, decodes the gzipped callisto fits faster than astropy
+except ImportError:
+    fitsio = None
+
+# one keep-alive session for index pages and file downloads from the callisto archive
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=16,
+                                      max_retries=Retry(total=3, backoff_factor=0.5)))
 
 
 class CallistoSpectrogram:
@@ -16,18 +31,14 @@ class CallistoSpectrogram:
     basic class for reading and plotting e-callisto dynamic spectra
     """
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, load_data=True):
         """
         initialize by reading a .fit.gz file
+        with load_data=False only the header (axes, times) is read; call load_data() later
         """
         self.filepath = filepath
-        self.hdul = fits.open(filepath)
-
-        raw_data = self.hdul[0].data
-        raw_data = np.ma.filled(raw_data, fill_value=np.nan)
-        self.data = np.asarray(raw_data, dtype=float)
-
-        self.header = self.hdul[0].header
+        self.header = read_callisto_header(filepath)
+        self.data = None
 
         self.n_time = self.header['NAXIS1']
         self.n_freq = self.header['NAXIS2']
@@ -39,17 +50,58 @@ class CallistoSpectrogram:
         )
 
         self.freq_axis = self.freq_axis[::-1]
-        self.data = self.data[::-1, :]
 
         time_start = self.header['DATE-OBS'] + 'T' + self.header['TIME-OBS']
 
         self.start_time = parse_time(time_start)
-        self.time_axis = [
-            self.start_time + timedelta(seconds=i * self.header['CDELT1'])
-            for i in range(self.n_time)
-        ]
+        self.time_axis = self.start_time + TimeDelta(np.arange(self.n_time) * self.header['CDELT1'], format='sec')
         self.end_time = self.time_axis[-1]
 
+        if load_data:
+            self.load_data()
+
+    @classmethod
+    def from_header(cls, filepath):
+        """
+        header-only spectrogram, pixel data not decompressed yet
+        """
+        return cls(filepath, load_data=False)
+
+    def load_data(self):
+        """
+        read the image (frequency reversed to match freq_axis)
+        kept in the file dtype as a reversed view; get_ecallisto_data makes the one float copy
+        """
+        if self.data is None:
+            self.data = read_callisto_data(self.filepath)[::-1, :]
+        return self
+
+
+def read_callisto_header(filepath):
+    """
+    read primary header of a callisto .fit.gz file
+    uses fitsio if available, else astropy
+    """
+    if fitsio is not None:
+        return fitsio.read_header(filepath)
+    return fits.getheader(filepath)
+
+
+def read_callisto_data(filepath):
+    """
+    read primary image of a callisto .fit.gz file in its stored dtype (no float copy)
+    masked pixels (astropy only) become nan
+    uses fitsio if available, else astropy
+    """
+    if fitsio is not None:
+        return fitsio.read(filepath)
+
+    with fits.open(filepath) as hdul:
+        raw_data = hdul[0].data
+        if np.ma.isMaskedArray(raw_data):
+            raw_data = np.ma.filled(raw_data.astype(float), fill_value=np.nan)
+        return raw_data
+
 
 def get_ecallisto_data(flare_start, flare_end):
     """
@@ -57,41 +109,99 @@ def get_ecallisto_data(flare_start, flare_end):
     assumes all files have the same frequency axis shape and values
     """
 
-    ecallisto_paths = find_matching_callisto_files(flare_start, flare_end)
+    ecallisto_paths = sorted(find_matching_callisto_files(flare_start, flare_end) or [])  # sort by time
 
     all_data = []
     all_time = []
     freq_axis = None
-    freq_shape = None
-
-    for path in sorted(ecallisto_paths):  # sort by time
-        logging.info(f"Loading {path}")
-        try:
-            spec = CallistoSpectrogram(path)
-
-            # compare frequency axes
-            if freq_axis is None:
-                freq_axis = spec.freq_axis
-                freq_shape = spec.data.shape[1]
-            elif (
-                not np.allclose(freq_axis, spec.freq_axis, atol=0.01)
-                or spec.data.shape[1] != freq_shape
-            ):
-                logging.info(f"Skipping {path}: incompatible frequency axis or shape")
-                continue
 
+    # headers first, so incompatible files are never decompressed
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(ecallisto_paths)))) as ex:
+        specs = []
+        for path, spec in zip(ecallisto_paths, ex.map(_load_callisto_header, ecallisto_paths)):
+            logging.info(f"Loading {path}")
+            if isinstance(spec, Exception):
+                logging.info(f"Failed to load {path}: {spec}")
+                continue
+            specs.append(spec)
+
+        # compare frequency axes of all files in one pass against the most common axis
+        keep = compatible_freq_axes(specs)
+        for spec in (s for s, ok in zip(specs, keep) if not ok):
+            logging.info(f"Skipping {spec.filepath}: incompatible frequency axis or shape")
+        specs = [s for s, ok in zip(specs, keep) if ok]
+        if specs:
+            freq_axis, freq_shape = specs[0].freq_axis, specs[0].n_freq
+
+        # decode the kept files concurrently (gzip inflate releases the gil), in time order
+        for spec, err in zip(specs, ex.map(_load_callisto_data, specs)):
+            if err is not None:
+                logging.info(f"Failed to load {spec.filepath}: {err}")
+                continue
             all_data.append(spec.data)
-            all_time.extend(spec.time_axis)
-
-        except Exception as e:
-            logging.info(f"Failed to load {path}: {e}")
-            continue
+            all_time.append(spec.time_axis)
 
     if not all_data:
         return None, None, None
 
-    combined_data = np.concatenate(all_data, axis=0)  # stack along time axis
-    return combined_data, all_time, freq_axis
+    # stack along the time axis into one preallocated float32 array (callisto
+    # samples are 8 bit, so float32 is exact); each reversed view is copied once
+    combined_data = np.empty((freq_shape, sum(d.shape[1] for d in all_data)), dtype=np.float32)
+    offset = 0
+    for d in all_data:
+        combined_data[:, offset:offset + d.shape[1]] = d
+        offset += d.shape[1]
+    combined_time = Time(
+        np.concatenate([t.jd1 for t in all_time]), np.concatenate([t.jd2 for t in all_time]),
+        format='jd', scale=all_time[0].scale
+    )
+    return combined_data, combined_time, freq_axis
+
+
+def compatible_freq_axes(specs, atol=0.01):
+    """
+    boolean mask of spectrograms whose frequency axis matches the most common one
+    axes are linear, so comparing channel count and both end frequencies is the same
+    test as np.allclose over the whole axis
+    """
+    if not specs:
+        return np.zeros(0, dtype=bool)
+    n_freq = np.array([s.n_freq for s in specs])
+    f_lo = np.array([s.freq_axis[0] for s in specs])
+    f_hi = np.array([s.freq_axis[-1] for s in specs])
+
+    # modal (channels, ends) triple, rounded to the tolerance; ties go to the earliest file
+    keys = np.stack([n_freq, np.round(f_lo / atol), np.round(f_hi / atol)], axis=1)
+    _, first, counts = np.unique(keys, axis=0, return_index=True, return_counts=True)
+    best = np.flatnonzero(counts == counts.max())
+    ref = first[best].min()
+
+    return (
+        (n_freq == n_freq[ref])
+        & np.isclose(f_lo, f_lo[ref], atol=atol)
+        & np.isclose(f_hi, f_hi[ref], atol=atol)
+    )
+
+
+def _load_callisto_header(path):
+    """
+    header-only spectrogram for the worker pool; returns the exception instead of raising
+    """
+    try:
+        return CallistoSpectrogram.from_header(path)
+    except Exception as e:
+        return e
+
+
+def _load_callisto_data(spec):
+    """
+    load the pixel data in a worker; returns the exception instead of raising, else None
+    """
+    try:
+        spec.load_data()
+    except Exception as e:
+        return e
+    return None
 
 
 def find_matching_callisto_files(flare_start, flare_end, download_folder='/mnt/nas05/data02/predrag/data/ecallisto'):
@@ -107,28 +217,25 @@ def find_matching_callisto_files(flare_start, flare_end, download_folder='/mnt/n
     if not files:
         return None
     
-    matching_files = []
+    matching = []
+    file_duration = timedelta(minutes=15)
+    flare_start, flare_end = normalize(flare_start), normalize(flare_end)
 
+    # cheap string filters first; only australia-assa 62 files get their time parsed
     for fname in files:
-        if "australia-assa" in fname.lower():
-            obs_guess, type = parse_file_time(fname)
-            if type == "62.fit.gz":
-                file_duration = 15  
-                obs_start = obs_guess
-                obs_end = obs_start + timedelta(minutes=file_duration)
-
-                # only keep files that fully contain the flare
-                if normalize(obs_start) <= normalize(flare_end) and normalize(obs_end) >= normalize(flare_start):
-
-                    file_url = base_url + fname
-                    local_path = os.path.join(download_folder, fname)
-                    local_file = download_callisto_file(file_url, local_path)
+        if not fname.endswith("_62.fit.gz") or "australia-assa" not in fname.lower():
+            continue
+        obs_start, _ = parse_file_time(fname)
+        obs_end = obs_start + file_duration
 
-                    if local_file is None:
-                        continue
+        # only keep files that fully contain the flare
+        if obs_start <= flare_end and obs_end >= flare_start:
+            matching.append((base_url + fname, os.path.join(download_folder, fname)))
 
-                    matching_files.append(local_file)
-    return matching_files
+    # fetch all matching files over the shared session at once
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(matching)))) as ex:
+        local_files = ex.map(lambda job: download_callisto_file(*job), matching)
+        return [f for f in local_files if f is not None]
 
 
 def list_callisto_files(date):
@@ -139,15 +246,22 @@ def list_callisto_files(date):
     url = f"{base_url}/{date.year}/{date.strftime('%m')}/{date.strftime('%d')}/"
 
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        return _fetch_callisto_index(url), url
     except Exception as e:
         logging.info(f"could not connect to {url}: {e}")
         return [], url
 
+
+@lru_cache(maxsize=64)
+def _fetch_callisto_index(url):
+    """
+    .fit.gz file names listed on one archive day page; cached per url (failures are not cached)
+    """
+    response = _session.get(url, timeout=10)
+    response.raise_for_status()
+
     soup = BeautifulSoup(response.text, 'html.parser')
-    files = [a['href'] for a in soup.find_all('a', href=True) if a['href'].endswith('.fit.gz')]
-    return files, url
+    return tuple(a['href'] for a in soup.find_all('a', href=True) if a['href'].endswith('.fit.gz'))
 
 
 def download_callisto_file(file_url, save_path):
@@ -159,11 +273,11 @@ def download_callisto_file(file_url, save_path):
         return save_path
 
     try:
-        r = requests.get(file_url, stream=True)
-        r.raise_for_status()
-        with open(save_path, 'wb') as f:
-            for chunk in r.iter_content(1024):
-                f.write(chunk)
+        with _session.get(file_url, stream=True, timeout=30) as r:
+            r.raise_for_status()
+            with open(save_path, 'wb') as f:
+                for chunk in r.iter_content(1 << 16):
+                    f.write(chunk)
         logging.info(f"downloaded file: {save_path}")
         return save_path
     except Exception as e:
@@ -195,7 +309,7 @@ def normalize(ts):
 
 
 from helper_functions.spectrogram import subtract_background
-def plot_ecallistio(row, ax, fig, gs):
+def plot_ecallistio(row, ax, cbar_ax):
     """ 
     plots e-Callisto spectrogram for Australia-ASSA
     """
@@ -205,10 +319,14 @@ def plot_ecallistio(row, ax, fig, gs):
     data, time_axis, freq_axis = get_ecallisto_data(flare_start, flare_end)
     data = subtract_background(data)
     if data is not None:
+        image, vmin, vmax = spectrogram_display(data)
         im = ax.imshow(
-            data,
+            image,
             aspect='auto',
             origin='lower',
+            interpolation='nearest',
+            vmin=vmin,
+            vmax=vmax,
             extent=[time_axis[0].to_datetime(), time_axis[-1].to_datetime(), freq_axis[0], freq_axis[-1]],
         )
         set_x_ticks(ax)
@@ -216,7 +334,7 @@ def plot_ecallistio(row, ax, fig, gs):
         ax.set_xlabel('Time [UTC]')
         ax.set_ylabel('Frequency [MHz]')
         ax.set_xlim(safe_parse_time(flare_start), safe_parse_time(flare_end))
-        cbar_ax = fig.add_subplot(gs[4, 1])
+        cbar_ax.set_axis_on()
         plt.colorbar(im, cax=cbar_ax)
     else:
         ax.text(0.5, 0.5, 'No matching e-CALLISTO files found', ha='center', va='center')
\ No newline at end of file
@@ -2,29 +2,41 @@ import ast
 import pyvo
 import logging
 import requests
+from requests.adapters import HTTPAdapter
 import numpy as np
 import pandas as pd
-from dateutil import parser
-from datetime import timedelta
 from collections import Counter
 import matplotlib.pyplot as plt
 from helper_functions.spectrogram import get_spectrogram
-from helper_functions.utils import safe_parse_time, set_x_ticks
+from helper_functions.utils import safe_parse_time, set_x_ticks, spectrogram_display
+
+
+# keep-alive session for tap queries, reused across flares in a batch run
+# (requests already sends Accept-Encoding: gzip, so csv responses come compressed)
+_tap_session = requests.Session()
+_tap_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+# the only metadata columns the spectrogram path reads
+METADATA_COLUMNS = "obs_id, starttime_utc, stoptime_utc"
 
 
 def get_mwa_metadata(start_time=None, end_time=None, obs_ids=None):
     """
-    get metadata for an mwa observation
+    get metadata for an mwa observation, sorted by start time on the server
     """
     # construct the ADQL query
     if obs_ids is not None:
         ids_formatted = ', '.join(f"'{id}'" for id in obs_ids)
-        query = f"SELECT * FROM mwa.observation WHERE obs_id IN ({ids_formatted})"
+        query = f"""
+        SELECT {METADATA_COLUMNS} FROM mwa.observation WHERE obs_id IN ({ids_formatted})
+        ORDER BY starttime_utc
+        """
     elif start_time is not None and end_time is not None:
         query = f"""
-        SELECT * FROM mwa.observation
+        SELECT {METADATA_COLUMNS} FROM mwa.observation
         WHERE stoptime_utc >= '{format_time_for_mwa(start_time)}'
         AND starttime_utc <= '{format_time_for_mwa(end_time)}'
+        ORDER BY starttime_utc
         """
     else:
         raise ValueError("invalid parameters. provide either 'obs_id' or both 'start_time' and 'end_time'.")
@@ -41,13 +53,12 @@ def get_mwa_metadata(start_time=None, end_time=None, obs_ids=None):
     }
 
     # make the request
-    response = requests.post(tap_url, data=data)
+    response = _tap_session.post(tap_url, data=data)
     response.raise_for_status()  # raise error if HTTP status is not 200
 
     # convert to pandas dataframe
     from io import StringIO
     df = pd.read_csv(StringIO(response.text))
-    df = df.sort_values(by="starttime_utc").reset_index(drop=True)
     logging.info(f"number of found observations is {len(df)}")
     return df
 
@@ -56,7 +67,7 @@ def format_time_for_mwa(time_str):
     """
     format time string for mwa queries
     """
-    dt = parser.parse(time_str)
+    dt = pd.Timestamp(time_str)
      # format the datetime to the desired format, cutting off milliseconds to 3 digits
     formatted_time = dt.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
     return formatted_time
@@ -66,7 +77,16 @@ def get_mwa_light_curve(spectrogram):
     """
     download and process mwa light curve
     """
-    return np.ma.sum(spectrogram, axis=0) if spectrogram is not None else None
+    if spectrogram is None:
+        return None
+    if np.ma.isMaskedArray(spectrogram):
+        spectrogram = spectrogram.filled(np.nan)
+
+    # plain nan-aware reduction; gap columns (all nan) stay nan so they are not drawn
+    # (accumulate in float32: spectrograms are stored as float16)
+    light_curve = np.nansum(spectrogram, axis=0, dtype=np.float32)
+    light_curve[np.isnan(spectrogram).all(axis=0)] = np.nan
+    return light_curve
 
 
 def estimate_time_resolution(spectrograms, times):
@@ -91,7 +111,7 @@ def estimate_time_resolution(spectrograms, times):
 
 ### plotting functions ###
 
-def plot_mwa_from_obs_ids(obs_ids, axes, gs, fig, data_path):
+def plot_mwa_from_obs_ids(obs_ids, axes, cbar_ax, data_path):
     """ 
     plots MWA spectrograms for observation IDs defined in obs_ids.
     """
@@ -106,14 +126,14 @@ def plot_mwa_from_obs_ids(obs_ids, axes, gs, fig, data_path):
         return None, None
 
     im, time_axis = draw_mwa_spectrogram(spec, times, freqs, axes[1], safe_parse_time(times[0][0]), safe_parse_time(times[-1][-1]))
-    cbar_ax = fig.add_subplot(gs[1, 1])
+    cbar_ax.set_axis_on()
     plt.colorbar(im, cax=cbar_ax, label='Power')
     axes[1].set_title('Dynamic spectrum from MWA observations')
 
     return spec, time_axis
 
 
-def plot_mwa_from_flare_row(flare_row, ax, fig, gs, path_to_data):
+def plot_mwa_from_flare_row(flare_row, ax, cbar_ax, path_to_data):
     """ 
     plots MWA spectrograms for the flare defined in flare_row.
     """
@@ -131,7 +151,7 @@ def plot_mwa_from_flare_row(flare_row, ax, fig, gs, path_to_data):
     
     im, time_axis = draw_mwa_spectrogram(spec, times, freqs, ax, start_time, end_time)
 
-    cbar_ax = fig.add_subplot(gs[1, 1])
+    cbar_ax.set_axis_on()
     plt.colorbar(im, cax=cbar_ax)
 
     project_summary = get_project_summary(flare_row["projectids"])
@@ -147,14 +167,19 @@ def draw_mwa_spectrogram(spec, times, freqs, ax, start_cut, end_cut, time_res=4)
     end_time = safe_parse_time(times[-1][-1])
     num_cols = spec.shape[1]
 
-     # generate equally spaced time axis between start_time and end_time
-    dt = (end_time - start_time) / (num_cols - 1) if num_cols > 1 else timedelta(seconds=time_res)
-    time_axis = [start_time + i * dt for i in range(num_cols)]
+     # generate equally spaced time axis between start_time and end_time (one datetime64 array)
+    time_axis = pd.date_range(start_time, end_time, periods=num_cols) if num_cols > 1 else pd.DatetimeIndex([start_time])
 
+    # the renderer resamples to the axis width anyway; don't push far more columns than pixels
+    width_px = max(int(ax.get_window_extent().width), 1)
+    image, vmin, vmax = spectrogram_display(downsample_columns(spec, width_px))
     im = ax.imshow(
-        spec,
+        image,
         aspect='auto',
         origin='lower',
+        interpolation='nearest',
+        vmin=vmin,
+        vmax=vmax,
         extent=[time_axis[0], time_axis[-1], freqs[0], freqs[-1]]
     )
 
@@ -168,6 +193,23 @@ def draw_mwa_spectrogram(spec, times, freqs, ax, start_cut, end_cut, time_res=4)
     return im, time_axis
 
 
+def downsample_columns(spec, target_px, oversample=4):
+    """
+    block-average time columns so at most ~oversample * target_px remain (display only)
+    nan entries (including gaps) are ignored in the means; all-nan blocks stay nan
+    """
+    n_freq, n_cols = spec.shape
+    factor = n_cols // (oversample * target_px)
+    if factor < 2:
+        return spec
+    n_blocks = n_cols // factor
+    blocks = np.ma.filled(spec[:, :n_blocks * factor], np.nan).astype(np.float32, copy=False)
+    blocks = blocks.reshape(n_freq, n_blocks, factor)
+    valid = np.isfinite(blocks)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid, blocks, 0).sum(axis=2) / valid.sum(axis=2)
+
+
 def get_project_summary(projectids):
     """
     get project summary from the metadata
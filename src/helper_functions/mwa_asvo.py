@@ -17,6 +17,8 @@ def create_jobs(observations, job_info):
     job_type: 'c' for conversion, 'v' for voltage, 'm' for metafits-only
     """
     job_type = job_info.get('job_type', 'c')
+    # one job per obs id, keeping the first-seen order
+    observations = list(dict.fromkeys(observations))
 
     if job_type == 'c':
         time_resolution = job_info.get('avg_time_res', 4)
@@ -66,11 +68,14 @@ def create_jobs(observations, job_info):
 def process_jobs(jobs):
     """
     process job queue for mwa asvo downloads
+    returns True if the jobs were processed without raising
     """
     try:
         process_mwa_asvo_jobs(jobs)
+        return True
     except Exception as e:
         logging.info(f"Processing MWA ASVO jobs failed: {e}")
+        return False
 
 
 def process_mwa_asvo_jobs(jobs):
@@ -81,6 +86,8 @@ def process_mwa_asvo_jobs(jobs):
     params, sslopt, verbose = initialize_settings()
     submit_lock, download_queue, result_queue, status_queue = initialize_queues_and_locks()
     session, jobs_list = login_and_submit_jobs(params, download_queue, status_queue, jobs)
+    # wake handle_results as soon as the last job is removed instead of polling
+    jobs_list = _JobList(jobs_list, on_empty=lambda: result_queue.put(_ALL_JOBS_DONE))
     start_status_thread(status_queue)
     notify = initialize_notifier(params, sslopt, submit_lock, jobs_list, download_queue, result_queue, status_queue, verbose)
     threads = start_download_threads(submit_lock, jobs_list, download_queue, result_queue, status_queue, session, data_path)
@@ -169,12 +176,16 @@ def initialize_notifier(params, sslopt, submit_lock, jobs_list, download_queue,
     return notify
 
 
+MAX_PARALLEL_DOWNLOADS = 8
+
+
 def start_download_threads(submit_lock, jobs_list, download_queue, result_queue, status_queue, session, data_path):
     """
     start download threads for data products
+    capped at MAX_PARALLEL_DOWNLOADS; each thread keeps taking jobs off download_queue
     """
     threads = []
-    for _ in range(len(jobs_list)):
+    for _ in range(max(1, min(len(jobs_list), MAX_PARALLEL_DOWNLOADS))):
         t = Thread(
             target=download_func,
             args=(
@@ -193,9 +204,42 @@ def start_download_threads(submit_lock, jobs_list, download_queue, result_queue,
     return threads
 
 
+_ALL_JOBS_DONE = object()
+
+
+class _JobList(list):
+    """
+    jobs list shared with the mantaray threads; calls on_empty once the last job is
+    removed, so the results loop can block instead of polling
+    """
+
+    def __init__(self, jobs, on_empty):
+        super().__init__(jobs)
+        self._on_empty = on_empty
+
+    def _check_empty(self):
+        if not self:
+            self._on_empty()
+
+    def remove(self, value):
+        super().remove(value)
+        self._check_empty()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._check_empty()
+        return value
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._check_empty()
+
+
 def handle_results(submit_lock, jobs_list, result_queue, download_queue, threads):
     """
     handle completed job results
+    blocks on result_queue; _JobList posts _ALL_JOBS_DONE when the last job finishes
+    (the long timeout only guards against a jobs list emptied some other way)
     """
     results = []
     while True:
@@ -204,7 +248,9 @@ def handle_results(submit_lock, jobs_list, result_queue, download_queue, threads
                 break
 
         try:
-            r = result_queue.get(timeout=1)
+            r = result_queue.get(timeout=30)
+            if r is _ALL_JOBS_DONE:
+                continue
             if not r:
                 raise Exception("Error: Control connection lost, exiting")
             results.append(r)
@@ -232,7 +278,7 @@ def cleanup(notify, threads, result_queue, status_queue, results):
 
     while not result_queue.empty():
         r = result_queue.get()
-        if r:
+        if r and r is not _ALL_JOBS_DONE:
             results.append(r)
 
     if results:
@@ -1,93 +1,259 @@
 from pathlib import Path
 import os, shutil, subprocess, logging, re
+from itertools import chain
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from casacore.tables import table
 from astropy.io import fits
+from astropy.wcs import WCS
 from astropy.time import Time, TimeDelta
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from matplotlib.animation import FFMpegWriter
-from helper_functions.utils import find_data_column, reset_dir
+import imageio.v2 as imageio
+from helper_functions.utils import find_data_column, reset_dir, mwa_tool_env
 
 log = logging.getLogger(__name__)
 
+_INTERVAL_RE = re.compile(r"^wsclean-t(?P<t>\d{4})-(?P<rest>.+)$")
 
-def run_wsclean(ms_path: Path, interval_count: int, work_dir: Path, n_iter=10, image_size_pixels=2048, scale_arcsec_per_pixel=5):
+
+def run_wsclean(ms_path: Path, interval_count: int, work_dir: Path, n_iter=10, image_size_pixels=2048,
+                scale_arcsec_per_pixel=5, shards=1):
     """
     run wsclean snapshot imaging
+    shards > 1 splits the timesteps into contiguous ranges imaged by concurrent wsclean
+    processes (each with its share of the cores); outputs are renamed to the global
+    wsclean-tNNNN-* numbering, so callers see the same files as from a single run
     """
     reset_dir(work_dir)
-    cmd = [
-        "wsclean",
-        "-data-column", find_data_column(ms_path),
-        "-intervals-out", str(interval_count),
-        "-size", str(image_size_pixels), str(image_size_pixels),
-        "-scale", f"{scale_arcsec_per_pixel}asec",
-        "-pol", "xx,yy",
-        "-join-polarizations",
-
-        "-niter", n_iter, 
-        "-auto-mask", "3",
-        "-auto-threshold", "0.7",
-        "-multiscale",
-        "-mgain", "0.8",
-        "-weight", "briggs", "0",
-        #"-apply-primary-beam",
-
-        str(ms_path),
-    ]
-
-    env = dict(os.environ, OPENBLAS_NUM_THREADS="1")
-    env["MWA_BEAM_FILE"] = str(Path.home() / "local/share/mwa_full_embedded_element_pattern.h5")
-
-    res = subprocess.run(
-        cmd, cwd=work_dir, env=env,
-        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-        text=True, check=True
-    )
-    log.info("wsclean output:\n%s", res.stdout)
-
-
-def load_stokes_i_stack(work_dir: Path) -> np.ndarray:
-    """
-    load stokes i image stack from mwa data
-    read wsclean fits files into [t, y, x] cube
-    """
-    files = sorted(work_dir.glob("wsclean-t*-image.fits"))
-    if not files:
+    ncpu = os.cpu_count() or 1
+    # at least two intervals per shard: with -intervals-out 1 wsclean drops the -tNNNN
+    # part of the file names, which the renumbering below relies on
+    shards = max(1, min(shards, interval_count // 2))
+    bounds = np.linspace(0, interval_count, shards + 1).round().astype(int)
+    data_column = find_data_column(ms_path)
+
+    # no OPENBLAS_NUM_THREADS pin: wsclean's own threading is set with -j
+    env = mwa_tool_env()
+
+    def _run(first, last, shard_dir, threads):
+        cmd = [
+            "wsclean",
+            "-j", str(threads),
+            "-parallel-gridding", str(min(4, threads)),
+            "-data-column", data_column,
+            "-intervals-out", str(last - first),
+            "-size", str(image_size_pixels), str(image_size_pixels),
+            "-scale", f"{scale_arcsec_per_pixel}asec",
+            "-pol", "xx,yy",
+            "-join-polarizations",
+
+            "-niter", str(n_iter),
+            "-auto-mask", "3",
+            "-auto-threshold", "0.7",
+            "-multiscale",
+            "-mgain", "0.8",
+            "-weight", "briggs", "0",
+            #"-apply-primary-beam",
+        ]
+        if shards > 1:
+            # concurrent runs read the same ms, so none of them may write MODEL_DATA back
+            cmd += ["-interval", str(first), str(last), "-no-update-model-required"]
+        cmd.append(str(ms_path))
+
+        res = subprocess.run(
+            cmd, cwd=shard_dir, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, check=True
+        )
+        log.info("wsclean output:\n%s", res.stdout)
+
+    if shards == 1:
+        _run(0, interval_count, work_dir, ncpu)
+        return
+
+    shard_dirs = [work_dir / f"shard{j:02d}" for j in range(shards)]
+    for d in shard_dirs:
+        d.mkdir()
+    threads = max(1, ncpu // shards)
+    with ThreadPoolExecutor(max_workers=shards) as ex:
+        list(ex.map(_run, bounds[:-1], bounds[1:], shard_dirs, [threads] * shards))
+
+    # shard-local interval numbers -> global ones
+    for first, d in zip(bounds[:-1], shard_dirs):
+        for f in d.iterdir():
+            m = _INTERVAL_RE.match(f.name)
+            if m:
+                f.rename(work_dir / f"wsclean-t{first + int(m['t']):04d}-{m['rest']}")
+        shutil.rmtree(d)
+
+
+_BITPIX_DTYPE = {8: ">u1", 16: ">i2", 32: ">i4", 64: ">i8", -32: ">f4", -64: ">f8"}
+
+
+def _fits_data_layout(path: Path):
+    """
+    (data offset, big-endian dtype, (ny, nx)) of the primary hdu, or None when the
+    data are scaled and have to go through astropy
+    """
+    with fits.open(path, memmap=True, lazy_load_hdus=True) as hdul:
+        hdr = hdul[0].header
+        if hdr.get("BSCALE", 1) != 1 or hdr.get("BZERO", 0) != 0:
+            return None
+        ny, nx = np.squeeze(hdul[0].data).shape
+        return hdul.fileinfo(0)["datLoc"], np.dtype(_BITPIX_DTYPE[hdr["BITPIX"]]), (ny, nx)
+
+
+def _same_layout(path: Path, offset: int, size: int) -> bool:
+    """
+    cheap check that a frame shares the reference layout: same file size and the
+    header's END card sits in the last record before the data offset
+    """
+    if os.path.getsize(path) != size:
+        return False
+    with open(path, "rb") as fh:
+        fh.seek(offset - fits.Card.length * 36)
+        rec = fh.read(fits.Card.length * 36)
+    return any(rec[i:i + 3] == b"END" and not rec[i + 3:i + 80].strip()
+               for i in range(0, len(rec), 80))
+
+
+def stokes_i_frame_files(work_dir: Path) -> list:
+    """
+    per-interval wsclean outputs in time order: (xx, yy) pairs when wsclean wrote
+    joined xx/yy polarization images, else single stokes-i images
+    """
+    xx = sorted(work_dir.glob("wsclean-t*-XX-image.fits"))
+    if xx:
+        frames = [(f, f.with_name(f.name.replace("-XX-", "-YY-"))) for f in xx]
+    else:
+        frames = [(f,) for f in sorted(work_dir.glob("wsclean-t*-image.fits"))]
+    if not frames:
         raise FileNotFoundError("no stokes-i fits produced")
-    stack = []
-    for f in files:
+    return frames
+
+
+def _stokes_i_reader(frames: list):
+    """
+    return (read_into(out, pols), (ny, nx)) for a list of frame files
+    wsclean writes identically laid out frames, so parse only the first header and
+    memory-map the raw data block of every frame at that offset; frames that do not
+    match (or scaled data) fall back to astropy
+    """
+    layout = _fits_data_layout(frames[0][0])
+    if layout is not None:
+        offset, dtype, (ny, nx) = layout
+        size = os.path.getsize(frames[0][0])
+    else:
+        with fits.open(frames[0][0], memmap=True, lazy_load_hdus=True) as hdul:
+            ny, nx = np.squeeze(hdul[0].data).shape
+
+    def _read(f):
+        if layout is not None and _same_layout(f, offset, size):
+            return np.memmap(f, dtype=dtype, mode="r", offset=offset, shape=(ny, nx))
         with fits.open(f, memmap=False) as hdul:
-            stack.append(np.squeeze(hdul[0].data))
-    return np.array(stack)
+            return np.squeeze(hdul[0].data)
+
+    def read_into(out, pols):
+        out[:] = _read(pols[0])
+        if len(pols) == 2:
+            # i = 0.5*(xx+yy) accumulated in place, no per-frame temporaries
+            np.add(out, _read(pols[1]), out=out)
+            np.multiply(out, 0.5, out=out)
+        return out
 
+    return read_into, (ny, nx)
 
-def animate_stack(stack: np.ndarray, times: Time, out_path: Path):
+
+def iter_stokes_i_frames(frames: list):
+    """
+    yield stokes i frames one at a time (float32 [y, x]) so a whole run never has
+    to sit in memory as a cube
+    """
+    read_into, shape = _stokes_i_reader(frames)
+    for pols in frames:
+        yield read_into(np.empty(shape, dtype=np.float32), pols)
+
+
+def _header_time_str(hdr):
     """
-    save stack as mp4 animation
+    safe time string from fits header (for logging/fig titles)
+    try date-obs, else mjd-obs; return short iso string
+    """
+    tstr = None
+    if "DATE-OBS" in hdr:
+        tstr = str(hdr["DATE-OBS"])
+    elif "MJD-OBS" in hdr:
+        try:
+            tstr = Time(float(hdr["MJD-OBS"]), format="mjd").isot
+        except Exception:
+            tstr = None
+    return tstr or "n/a"
+
+
+def load_frame_stack(frames: list):
+    """
+    read frame entries (see stokes_i_frame_files) into a float32 [t, y, x] cube, forming
+    i = 0.5*(xx+yy) for (xx, yy) pairs
+    returns (cube, times, wcs): per-frame header time strings and the first frame's wcs
+    """
+    read_into, (ny, nx) = _stokes_i_reader(frames)
+    stack = np.empty((len(frames), ny, nx), dtype=np.float32)
+    wcs = WCS(fits.getheader(frames[0][0]))
+
+    def _load(i):
+        read_into(stack[i], frames[i])
+        return _header_time_str(fits.getheader(frames[i][0]))
+
+    # frames are independent; reads are i/o bound and the numpy copy/add release the
+    # gil, so threads overlap disk and compute while writing straight into the shared
+    # cube (a process pool would have to ship every 2048² frame back through pickling)
+    workers = min(os.cpu_count() or 1, 8, len(frames))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        times = list(ex.map(_load, range(len(frames))))
+    return stack, times, wcs
+
+
+def animate_stack(frames, times: Time, out_path: Path):
+    """
+    save frames as mp4 animation
+    frames is any iterable of 2d images (a [t, y, x] cube or iter_stokes_i_frames),
+    consumed one frame at a time straight into ffmpeg
     """
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    fig, ax = plt.subplots()
+    fig, ax = plt.subplots(dpi=150)
     half = image_size_pixels * scale_arcsec_per_pixel / 2.0
     extent = [-half, +half, -half, +half]
 
-    img = ax.imshow(stack[0], cmap="gray", origin="lower", extent=extent)
-    title = ax.set_title("")
+    frames = iter(frames)
+    first = next(frames)
+    img = ax.imshow(first, cmap="gray", origin="lower", extent=extent, animated=True)
+    title = ax.set_title("", animated=True)
     ax.set_xlabel("x (arcsec)")
     ax.set_ylabel("y (arcsec)")
 
-    def update(frame):
-        frame_data = stack[frame]
-        img.set_data(frame_data)
-        img.set_clim(vmin=frame_data.min(), vmax=frame_data.max())
-        title.set_text(
-            f"solar radio emission (stokes i) – frame {frame}\n{times[frame].iso}"
-        )
-        return img, title
-
-    ani = animation.FuncAnimation(fig, update, frames=len(stack),
-                                  interval=50, blit=True)
-    ani.save(out_path, writer=FFMpegWriter(fps=20, bitrate=1800), dpi=150)
+    # encode through imageio-ffmpeg, feeding the rendered rgb canvas buffer directly
+    # (no png/savefig round trip per frame), and blit: render the static parts (axes,
+    # ticks, labels) once, then per frame restore that background and redraw only the
+    # image and title
+    writer = imageio.get_writer(str(out_path), fps=20, codec="libx264", quality=8,
+                                macro_block_size=None)
+    # format every frame label in one vectorized call instead of per-frame Time[i].iso
+    labels = np.atleast_1d(times.iso)
+    try:
+        fig.canvas.draw()
+        bg = fig.canvas.copy_from_bbox(fig.bbox)
+        for frame, data in enumerate(chain([first], frames)):
+            img.set_data(data)
+            img.set_clim(vmin=data.min(), vmax=data.max())
+            title.set_text(
+                f"solar radio emission (stokes i) – frame {frame}\n{labels[frame]}"
+            )
+            fig.canvas.restore_region(bg)
+            ax.draw_artist(img)
+            ax.draw_artist(title)
+            writer.append_data(np.asarray(fig.canvas.buffer_rgba())[..., :3])
+    finally:
+        writer.close()
+        plt.close(fig)
     log.info("animation saved → %s", out_path)
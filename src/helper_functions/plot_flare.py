@@ -7,7 +7,7 @@ from helper_functions.ecallisto import plot_ecallistio
 import logging
 
 
-def plot_flare(save_path, row=None, obs_ids=None):
+def plot_flare(save_path, row=None, obs_ids=None, figure=None):
     """
     plots spectrograms using either manually specified observation IDs or flare metadata
     
@@ -19,8 +19,14 @@ def plot_flare(save_path, row=None, obs_ids=None):
         - location of the stix instrument at a given time
         - eCALLISTO spectrograms if available
 
+    figure: optional (fig, axes, cbar_axes) from create_figure_and_axes to draw into;
+    it is cleared first and left open, so batch callers can reuse one figure
     """
-    fig, axes, cbar_gs = create_figure_and_axes(subplots=5)
+    if figure is None:
+        fig, axes, cbar_axes = create_figure_and_axes(subplots=5)
+    else:
+        fig, axes, cbar_axes = figure
+        reset_figure_axes(axes, cbar_axes)
     time_axis = []
     if row is not None:
         try:
@@ -29,20 +35,22 @@ def plot_flare(save_path, row=None, obs_ids=None):
             logging.info(f"Error plotting STIX light curve: {e}")
             axes[0].text(0.5, 0.5, 'STIX data not available', ha='center', va='center')
         try:
-            spec, time_axis = plot_mwa_from_flare_row(row, axes[1], fig, cbar_gs, get_root_path_to_data())
+            spec, time_axis = plot_mwa_from_flare_row(row, axes[1], cbar_axes[1], get_root_path_to_data())
         except Exception as e:
             logging.info(f"Error plotting MWA data: {e}")
             axes[1].text(0.5, 0.5, 'MWA spectrogram not available', ha='center', va='center')
     elif obs_ids is not None:
         try:
-            spec, time_axis = plot_mwa_from_obs_ids(obs_ids, axes, cbar_gs, fig, get_root_path_to_data())
+            spec, time_axis = plot_mwa_from_obs_ids(obs_ids, axes, cbar_axes[1], get_root_path_to_data())
         except Exception as e:
             logging.info(f"Error plotting MWA data: {e}")
             axes[1].text(0.5, 0.5, 'MWA spectrogram not available', ha='center', va='center')
     else:
         raise ValueError("Either row or obs_ids must be provided.")
 
-    if not time_axis:
+    if time_axis is None or len(time_axis) == 0:
+        if figure is None:
+            plt.close(fig)
         return True
 
     try:
@@ -57,32 +65,53 @@ def plot_flare(save_path, row=None, obs_ids=None):
             logging.info(f"Error plotting positions: {e}")
             axes[3].text(0.5, 0.5, 'Positions not available', ha='center', va='center')
         try:
-            plot_ecallistio(row, axes[4], fig, cbar_gs)
+            plot_ecallistio(row, axes[4], cbar_axes[4])
         except Exception as e:
             logging.info(f"Error plotting e-Callisto data: {e}")
             axes[4].text(0.5, 0.5, 'e-Callisto data not available', ha='center', va='center')
-    finalize_plot(fig, save_path)
-    plt.close(fig)
+    if figure is None:
+        finalize_plot(fig, save_path)
+    else:
+        fig.savefig(save_path)
 
     return False
 
 
 def create_figure_and_axes(subplots=5):
     """
-    create matplotlib figure and axes for flare plot
+    create matplotlib figure, plot axes and colorbar axes for flare plot
+    colorbar axes start hidden and are switched on by the plotter that uses them;
+    spacing is fixed on the gridspec so no layout pass is needed when saving
     """
     fig = plt.figure(figsize=(10, 18))
-    gs = GridSpec(subplots, 2, width_ratios=[1, 0.05], height_ratios=[1 for _ in range(subplots)])
+    gs = GridSpec(subplots, 2, figure=fig, width_ratios=[1, 0.05], height_ratios=[1 for _ in range(subplots)],
+                  left=0.09, right=0.93, bottom=0.04, top=0.97, wspace=0.05, hspace=0.45)
     axes = [fig.add_subplot(gs[i, 0]) for i in range(subplots)]
-    return fig, axes, gs
+    cbar_axes = [fig.add_subplot(gs[i, 1]) for i in range(subplots)]
+    for cbar_ax in cbar_axes:
+        cbar_ax.set_axis_off()
+    return fig, axes, cbar_axes
+
+
+def reset_figure_axes(axes, cbar_axes):
+    """
+    clear a figure from create_figure_and_axes so it can be drawn again
+    """
+    for ax in axes:
+        ax.cla()
+        ax.set_axis_on()
+    for cbar_ax in cbar_axes:
+        cbar_ax.cla()
+        # cla keeps the locator colorbar() installed; each new colorbar would wrap it again
+        cbar_ax.set_axes_locator(None)
+        cbar_ax.set_axis_off()
 
 
 def finalize_plot(fig, save_path):
     """
     finalize and save flare plot
     """
-    plt.tight_layout()
-    plt.savefig(save_path)
+    fig.savefig(save_path)
     plt.close(fig)
 
 
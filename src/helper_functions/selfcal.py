@@ -1,18 +1,16 @@
-import logging, subprocess, shutil, tarfile
+import logging, shutil, tarfile
 from pathlib import Path
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
-from astropy.io import fits
 from astropy.wcs import WCS
-from astropy.time import Time
-from astropy.coordinates import SkyCoord, GCRS, get_sun
-import astropy.units as u
 
 from scipy import ndimage as ndi
 from scipy.optimize import least_squares
 import matplotlib.pyplot as plt
 from matplotlib import animation
 from helper_functions.utils import get_time_info, ms_central_frequency, _extract_metafits_from_tar
+from helper_functions.calibration import run_hyperdrive
 import helper_functions.mwa_imaging as imaging
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
@@ -20,7 +18,8 @@ TMP_DIR = Path("/mnt/nas05/data02/predrag/data/mwa_data/tmp")
 
 
 def self_calibrate(ms_in: Path, work_root: Path, iterations: int = 2,
-                   wsclean_niter: int = 10, auto_threshold: float = 5.0) -> Path:
+                   wsclean_niter: int = 10, auto_threshold: float = 5.0,
+                   wsclean_shards: int = 1) -> Path:
     """
     run a simple phase-only self-calibration loop:
       1) shallow wsclean per-interval imaging
@@ -28,58 +27,68 @@ def self_calibrate(ms_in: Path, work_root: Path, iterations: int = 2,
       3) write one-point sky model
       4) solve and apply gains
     returns final self-calibrated ms path
+    wsclean_shards > 1 images interval ranges in concurrent wsclean processes
     """
     work_root = Path(work_root); work_root.mkdir(parents=True, exist_ok=True)
     current_ms = Path(ms_in)
 
     start, dt, n = get_time_info(current_ms)
+    obs_id = current_ms.name.split("_")[0]
+    ref_freq = ms_central_frequency(current_ms)
+    # the disk barely moves between iterations; derive its mask once per obs + band
+    disk_cache = work_root / f"disk_mask_{obs_id}_{int(round(ref_freq / 1e6)):04d}mhz.npy"
 
     for it in range(1, iterations + 1):
         it_dir = work_root / f"selfcal_iter{it:02d}"
         it_dir.mkdir(parents=True, exist_ok=True)
 
-        run_wsclean(current_ms, n, it_dir, wsclean_niter)
+        imaging.run_wsclean(current_ms, n, it_dir, wsclean_niter, shards=wsclean_shards)
 
-        (best_ra, best_dec), results = find_burst_position(it_dir)
+        (best_ra, best_dec), results = find_burst_position(it_dir, disk_cache=disk_cache)
         
         srclist = it_dir / f"selfcal_iter{it:02d}.yaml"
         write_point_srclist(
             results, srclist,
             score_threshold=30.0, max_sources=4,
-            ref_freq=ms_central_frequency(current_ms),
+            ref_freq=ref_freq,
             flux_norm=500.0
         )
 
         sol_path = it_dir / f"selfcal_iter{it:02d}_sols.fits"
-        obs_id = current_ms.name.split("_")[0]
         metafits = _extract_metafits_from_tar(
             "/mnt/nas05/data02/predrag/data/mwa_data", 
             obs_id
         )
 
-        subprocess.run(
-            [
-                "hyperdrive","di-calibrate",
-                "-d", str(current_ms), str(metafits),
-                "-s", str(srclist),
-                "-o", str(sol_path),
-                "--min-uv-lambda", "0"
-            ],
-            check=True
+        run_hyperdrive(
+            "di-calibrate",
+            "-d", current_ms, metafits,
+            "-s", srclist,
+            "-o", sol_path,
+            "--min-uv-lambda", "0"
         )
 
         next_ms = current_ms.with_name(f"{current_ms.stem}_selfcal{it}{current_ms.suffix}")
         if next_ms.exists(): shutil.rmtree(next_ms)
-        subprocess.run(
-            ["hyperdrive","solutions-apply","-d",str(current_ms),str(metafits),
-             "-s",str(sol_path),"-o",str(next_ms)],
-            check=True
-        )
+        run_hyperdrive("solutions-apply", "-d", current_ms, metafits, "-s", sol_path, "-o", next_ms)
         current_ms = next_ms
 
     return current_ms
 
 
+def load_frame_cube(work_dir: Path, glob_pattern: str = "wsclean-*image.fits"):
+    """
+    read all matching fits frames once into a float32 [t, y, x] cube
+    (through mwa_imaging.load_frame_stack, which also serves the imaging side)
+    returns (fpaths, cube, times, wcs_ref) so callers can reuse the same frame list
+    """
+    fpaths = sorted(Path(work_dir).glob(glob_pattern))
+    if not fpaths:
+        raise FileNotFoundError(f"no fits found in {work_dir} matching {glob_pattern}")
+    cube, times, wcs_ref = imaging.load_frame_stack([(f,) for f in fpaths])
+    return fpaths, cube, times, wcs_ref
+
+
 def find_burst_position(work_dir: Path,
                         glob_pattern: str = "wsclean-*image.fits",
                         z_thresh: float = 5.0,
@@ -90,46 +99,43 @@ def find_burst_position(work_dir: Path,
                         exclude_limb_px: int = 8,
                         debug: bool = True,
                         debug_dir: Path = "/mnt/nas05/clusterdata01/home2/predrag/STIX-MWA/results/plots/coords",
-                        debug_max_frames: int = 6) -> tuple[float, float]:
+                        debug_max_frames: int = 6,
+                        disk_cache: Path = None) -> tuple[float, float]:
     """
     detect a transient burst by temporal background removal + spatial high-pass,
     then pick a compact local maximum inside the solar disk (limb excluded).
     returns (ra_deg, dec_deg)
 
     debug mode writes per-step figures and prints per-frame diagnostics.
+    loads the frames from work_dir and runs find_burst_position_batched on them.
+    """
+    _, cube, times, wcs_ref = load_frame_cube(work_dir, glob_pattern)
+    return find_burst_position_batched(
+        cube, times, wcs_ref,
+        z_thresh=z_thresh, min_pixels=min_pixels, smooth_sigma=smooth_sigma,
+        bg_sigma=bg_sigma, peak_half_width=peak_half_width, exclude_limb_px=exclude_limb_px,
+        debug=debug, debug_dir=debug_dir or (Path(work_dir) / "debug_find_flare"),
+        debug_max_frames=debug_max_frames, disk_cache=disk_cache,
+    )
+
+
+def find_burst_position_batched(cube: np.ndarray, times: list, wcs_ref: WCS,
+                                z_thresh: float = 5.0,
+                                min_pixels: int = 9,
+                                smooth_sigma: float = 1.0,
+                                bg_sigma: float = 8.0,
+                                peak_half_width: int = 4,
+                                exclude_limb_px: int = 8,
+                                debug: bool = True,
+                                debug_dir: Path = "/mnt/nas05/clusterdata01/home2/predrag/STIX-MWA/results/plots/coords",
+                                debug_max_frames: int = 6,
+                                disk_cache: Path = None) -> tuple[float, float]:
+    """
+    find_burst_position on an already loaded [t, y, x] cube (see load_frame_cube),
+    so callers that need the frames themselves read them only once
+    disk_cache: optional .npy path; the solar disk mask is loaded from it when it
+    exists (and matches the frame shape), otherwise built and saved there
     """
-
-    # helper: safe time string from fits header (for logging/fig titles)
-    def _header_time_str(hdr):
-        # try date-obs, else mjd-obs; return short iso string
-        tstr = None
-        if "DATE-OBS" in hdr:
-            tstr = str(hdr["DATE-OBS"])
-        elif "MJD-OBS" in hdr:
-            try:
-                tstr = Time(float(hdr["MJD-OBS"]), format="mjd").isot
-            except Exception:
-                tstr = None
-        return tstr or "n/a"
-
-    # collect frames
-    fpaths = sorted(Path(work_dir).glob(glob_pattern))
-    if not fpaths:
-        raise FileNotFoundError(f"no fits found in {work_dir} matching {glob_pattern}")
-
-    frames = []
-    times = []
-    wcs_ref = None
-    for p in fpaths:
-        with fits.open(p, memmap=False) as hdul:
-            img = np.asarray(hdul[0].data, dtype=np.float32)
-            img = np.squeeze(img)  # handle shapes like [1,y,x] or [pol,y,x]
-            frames.append(img)
-            times.append(_header_time_str(hdul[0].header))
-            if wcs_ref is None:
-                wcs_ref = WCS(hdul[0].header)
-
-    cube = np.stack(frames, axis=0)  # [t, y, x]
     ny, nx = cube.shape[1:]
 
     # optional light smoothing to suppress pixel noise
@@ -137,41 +143,33 @@ def find_burst_position(work_dir: Path,
         cube = ndi.gaussian_filter(cube, sigma=(0, smooth_sigma, smooth_sigma))
 
     # temporal median as quiet-sun background
-    med = np.median(cube, axis=0)
-
-    # build solar disk mask from median, keep largest blob, then erode to avoid limb
-    thr = np.percentile(med, 85)
-    disk = med > thr
-    disk = ndi.binary_opening(disk, iterations=2)
-    disk = ndi.binary_closing(disk, iterations=2)
-    labels, nlab = ndi.label(disk)
-    if nlab == 0:
-        disk = np.ones_like(med, dtype=bool)
-    elif nlab > 1:
-        sizes = ndi.sum(disk, labels, index=np.arange(1, nlab + 1))
-        keep = 1 + int(np.argmax(sizes))
-        disk = labels == keep
-    if exclude_limb_px > 0:
-        disk = ndi.binary_erosion(disk, iterations=exclude_limb_px)
+    med = temporal_median(cube)
+
+    disk = None
+    if disk_cache is not None and Path(disk_cache).exists():
+        disk = np.load(disk_cache)
+        if disk.shape != med.shape:
+            disk = None
+    if disk is None:
+        disk = solar_disk_mask(med, exclude_limb_px)
+        if disk_cache is not None:
+            np.save(disk_cache, disk)
 
     # precompute a thin border of the disk for overlays
     disk_border = disk ^ ndi.binary_erosion(disk, iterations=1)
 
-    # helper: robust sigma inside mask
-    def robust_sigma(a, mask):
-        vals = a[mask]
-        if vals.size == 0:
-            return 1.0
-        m = np.median(vals)
-        mad = np.median(np.abs(vals - m))
-        s = 1.4826 * mad
-        if not np.isfinite(s) or s <= 0:
-            s = np.std(vals) if np.std(vals) > 0 else 1.0
-        return float(s)
+    # temporal background removal + spatial high-pass for the whole cube at once
+    # (sigma 0 along t keeps frames independent, same as filtering frame by frame)
+    hp_cube = cube - med[None, :, :]
+    if bg_sigma > 0:
+        hp_cube -= ndi.gaussian_filter(hp_cube, sigma=(0, bg_sigma, bg_sigma))
+
+    # robust sigma inside the disk for every frame
+    sigmas = robust_sigmas(hp_cube[:, disk])
 
     # debug dir
     if debug:
-        debug_dir = Path(debug_dir or (Path(work_dir) / "debug_find_flare"))
+        debug_dir = Path(debug_dir or "debug_find_flare")
         debug_dir.mkdir(parents=True, exist_ok=True)
         # save median + mask overview
         fig, ax = plt.subplots(1, 3, figsize=(12, 3.5), constrained_layout=True)
@@ -188,79 +186,79 @@ def find_burst_position(work_dir: Path,
         fig.savefig(debug_dir / "median_and_mask.png", dpi=140)
         plt.close(fig)
 
-    # scan frames and score candidates
-    results = []  # list of dicts per frame
+    # scan frames and score candidates; per-frame fields go into parallel arrays
+    n_frames = len(cube)
+    xs_c = np.empty(n_frames); ys_c = np.empty(n_frames)
+    scores = np.empty(n_frames); peak_zs = np.empty(n_frames)
+    n_peaks = np.zeros(n_frames, dtype=int)
+    modes = np.empty(n_frames, dtype="U16")
 
     win_r = max(2, peak_half_width * 2)  # centroid window radius in pixels
 
-    for i, frame in enumerate(cube):
-        resid = frame - med
-        smooth_bg = ndi.gaussian_filter(resid, sigma=bg_sigma) if bg_sigma > 0 else 0.0
-        hp = resid - smooth_bg
-
-        s = robust_sigma(hp, disk)
-        z = np.where(disk, hp / s, 0.0)
-
-        # detect local maxima inside disk
-        max_filt = ndi.maximum_filter(z, size=(2 * peak_half_width + 1))
-        peaks = (z == max_filt) & (z > z_thresh) & disk
-        ys, xs = np.where(peaks)
-
-        candidates = []
-        for y0, x0 in zip(ys, xs):
-            y1 = max(0, y0 - win_r); y2 = min(ny, y0 + win_r + 1)
-            x1 = max(0, x0 - win_r); x2 = min(nx, x0 + win_r + 1)
-            w = np.maximum(hp[y1:y2, x1:x2], 0.0)
-            if (w > 0).sum() < min_pixels or w.sum() <= 0:
-                continue
-            yy, xx = np.indices(w.shape)
-            x_c = x1 + (w * xx).sum() / w.sum()
-            y_c = y1 + (w * yy).sum() / w.sum()
-            peak_z = float(z[y0, x0])
-            flux_sum = float(w.sum())
-            score = 3.0 * peak_z + np.log1p(flux_sum)
-            candidates.append((score, peak_z, flux_sum, x_c, y_c))
-
-        mode = "burst" if len(candidates) > 0 else "fallback"
-        if candidates:
-            candidates.sort(reverse=True, key=lambda t: t[0])
-            score, peak_z, flux_sum, x_c, y_c = candidates[0]
+    # z-scores inside disk and local maxima for all frames in one filter pass
+    # (size 1 along t keeps the maximum filter per frame)
+    k = 2 * peak_half_width + 1
+    z_cube = np.where(disk[None], hp_cube / sigmas.astype(np.float32)[:, None, None], 0.0)
+    max_filt = ndi.maximum_filter(z_cube, size=(1, k, k))
+    peak_idx = np.argwhere((z_cube == max_filt) & (z_cube > z_thresh) & disk[None])
+    del max_filt
+    # argwhere is row-major, so each frame's peaks form one contiguous run
+    bounds = np.searchsorted(peak_idx[:, 0], np.arange(n_frames + 1))
+
+    for i in range(n_frames):
+        hp = hp_cube[i]
+        z = z_cube[i]
+        ys, xs = peak_idx[bounds[i]:bounds[i + 1], 1:].T
+
+        # weighted centroids of all peaks of this frame at once
+        n_cand = 0
+        if len(ys):
+            cx, cy, wsum, npix = window_centroids(hp, ys, xs, win_r)
+            valid = (npix >= min_pixels) & (wsum > 0)
+            n_cand = int(valid.sum())
+        if n_cand:
+            cand_z = z[ys, xs].astype(float)
+            cand_score = np.where(valid, 3.0 * cand_z + np.log1p(np.where(valid, wsum, 0.0)), -np.inf)
+            j = int(np.argmax(cand_score))  # first peak wins ties, like the stable sort did
+            mode = "burst"
+            score, peak_z = float(cand_score[j]), float(cand_z[j])
+            x_c, y_c = float(cx[j]), float(cy[j])
         else:
+            mode = "fallback"
             # fallback: max positive high-pass residual inside disk
             masked = np.where(disk, hp, -np.inf)
             if np.all(~np.isfinite(masked)):
                 y_c, x_c = ny / 2.0, nx / 2.0
-                peak_z, flux_sum, score = 0.0, 0.0, -np.inf
+                peak_z, score = 0.0, -np.inf
                 mode = "fallback-center"
             else:
                 y_c, x_c = np.unravel_index(np.nanargmax(masked), masked.shape)
                 peak_z = float(z[int(y_c), int(x_c)])
-                flux_sum = float(max(masked[int(y_c), int(x_c)], 0.0))
                 score = peak_z
 
         # log per-frame summary (small and informative)
         logging.info(
             "frame %02d time=%s mode=%s peaks=%d peak_z=%.2f score=%.2f xy=(%.1f, %.1f)",
-            i, times[i], mode, int(len(candidates)), float(peak_z), float(score), float(x_c), float(y_c)
+            i, times[i], mode, n_cand, float(peak_z), float(score), float(x_c), float(y_c)
         )
 
-        results.append(dict(
-            idx=i, time=times[i], mode=mode, peaks=len(candidates),
-            peak_z=float(peak_z), score=float(score), x=float(x_c), y=float(y_c),
-            s=float(s)
-        ))
-
-    # add ra/dec to each entry
-    wcs_sky = wcs_ref.celestial
-    for r in results:
-        ra, dec = wcs_sky.all_pix2world(r["x"], r["y"], 0)
-        r["ra"] = float(ra)
-        r["dec"] = float(dec)
-
-    # choose best frame; prefer burst over fallback on ties
-    def _rank_key(d):
-        return (0 if d["mode"].startswith("burst") else 1, -d["score"])
-    best = sorted(results, key=_rank_key)[0]
+        xs_c[i], ys_c[i] = x_c, y_c
+        scores[i], peak_zs[i] = score, peak_z
+        n_peaks[i], modes[i] = n_cand, mode
+
+    # pixel → sky for all frames in one call using celestial sub-wcs
+    ras, decs = wcs_ref.celestial.all_pix2world(xs_c, ys_c, 0)
+
+    is_burst = np.char.startswith(modes, "burst")
+    results = [
+        dict(idx=i, time=times[i], mode=str(modes[i]), peaks=int(n_peaks[i]),
+             peak_z=float(peak_zs[i]), score=float(scores[i]), x=float(xs_c[i]), y=float(ys_c[i]),
+             s=float(sigmas[i]), ra=float(ras[i]), dec=float(decs[i]))
+        for i in range(n_frames)
+    ]
+
+    # choose best frame; prefer burst over fallback on ties (stable, first frame wins)
+    best = results[int(np.lexsort((-scores, ~is_burst))[0])]
     x_c, y_c = best["x"], best["y"]
     logging.info("picked frame %d (%s) score=%.2f @ (x=%.1f, y=%.1f) time=%s",
                  best["idx"], best["mode"], best["score"], x_c, y_c, best["time"])
@@ -268,21 +266,18 @@ def find_burst_position(work_dir: Path,
     # per-frame debug plots (top k by score + the best)
     if debug:
         # pick frames to visualize
-        top = sorted(results, key=lambda d: (-d["score"], d["mode"].startswith("burst") is False))[:debug_max_frames]
-        want_idxs = sorted({best["idx"], *[d["idx"] for d in top]})
+        top = np.lexsort((~is_burst, -scores))[:debug_max_frames]
+        want_idxs = sorted({best["idx"], *top.tolist()})
+        by, bx = np.where(disk_border)
 
         for i in want_idxs:
             frame = cube[i]
             resid = frame - med
-            smooth_bg = ndi.gaussian_filter(resid, sigma=bg_sigma) if bg_sigma > 0 else 0.0
-            hp = resid - smooth_bg
-            s = robust_sigma(hp, disk)
-            z = np.where(disk, hp / s, 0.0)
-
-            # peaks for overlay
-            max_filt = ndi.maximum_filter(z, size=(2 * peak_half_width + 1))
-            peaks = (z == max_filt) & (z > z_thresh) & disk
-            py, px = np.where(peaks)
+            # reuse the scan's high-pass, z map and peaks for this frame
+            hp = hp_cube[i]
+            s = sigmas[i]
+            z = z_cube[i]
+            py, px = peak_idx[bounds[i]:bounds[i + 1], 1:].T
 
             # figure with 2x3 panels
             fig, axes = plt.subplots(2, 3, figsize=(13, 7), constrained_layout=True)
@@ -306,8 +301,7 @@ def find_burst_position(work_dir: Path,
                 ax[4].scatter(px, py, s=20, facecolors="none", edgecolors="white", linewidths=1.0, label="peaks")
             ax[4].scatter(results[i]["x"], results[i]["y"], s=60, marker="x", linewidths=2.0, color="yellow", label="chosen")
             # draw disk border
-            by, bx = np.where(disk_border)
-            ax[4].scatter(bx, by, s=1, c="cyan", alpha=0.5, label="disk")
+            ax[4].plot(bx, by, ".", ms=1, color="cyan", alpha=0.5, linestyle="none", label="disk")
             ax[4].legend(loc="upper right", fontsize=8)
 
             # histogram of hp inside disk for sanity
@@ -319,14 +313,82 @@ def find_burst_position(work_dir: Path,
             fig.savefig(debug_dir / f"frame_{i:02d}_debug.png", dpi=140)
             plt.close(fig)
 
-    # pixel → sky using celestial sub-wcs
-    wcs_sky = wcs_ref.celestial
-    ra_deg, dec_deg = wcs_sky.all_pix2world(x_c, y_c, 0)
-    logging.info("burst centroid (ra, dec): %.6f, %.6f deg", ra_deg, dec_deg)
+    logging.info("burst centroid (ra, dec): %.6f, %.6f deg", best["ra"], best["dec"])
 
     return (best["ra"], best["dec"]), results
 
 
+def window_centroids(hp: np.ndarray, ys: np.ndarray, xs: np.ndarray, win_r: int):
+    """
+    positive-weight centroids in (2*win_r+1)^2 windows around the given peaks of one frame
+    the frame is zero padded, so windows at the border behave like clipped windows
+    returns (x_c, y_c, weight_sum, nonzero_pixels) arrays, one entry per peak
+    """
+    w = np.pad(np.maximum(hp, 0.0), win_r)
+    win = sliding_window_view(w, (2 * win_r + 1, 2 * win_r + 1))[ys, xs]  # (npeaks, k, k)
+    wsum = win.sum(axis=(1, 2), dtype=np.float64)
+    npix = np.count_nonzero(win, axis=(1, 2))
+    off = np.arange(-win_r, win_r + 1, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_c = xs + (win.sum(axis=1, dtype=np.float64) @ off) / wsum
+        y_c = ys + (win.sum(axis=2, dtype=np.float64) @ off) / wsum
+    return x_c, y_c, wsum, npix
+
+
+def solar_disk_mask(med: np.ndarray, exclude_limb_px: int = 8) -> np.ndarray:
+    """
+    build solar disk mask from median, keep largest blob, then erode to avoid limb
+    """
+    thr = np.percentile(med, 85)
+    disk = med > thr
+    disk = ndi.binary_opening(disk, iterations=2)
+    disk = ndi.binary_closing(disk, iterations=2)
+    labels, nlab = ndi.label(disk)
+    if nlab == 0:
+        disk = np.ones_like(med, dtype=bool)
+    elif nlab > 1:
+        sizes = ndi.sum(disk, labels, index=np.arange(1, nlab + 1))
+        keep = 1 + int(np.argmax(sizes))
+        disk = labels == keep
+    if exclude_limb_px > 0:
+        disk = ndi.binary_erosion(disk, iterations=exclude_limb_px)
+    return disk
+
+
+def temporal_median(cube: np.ndarray, block: int = 256) -> np.ndarray:
+    """
+    median over axis 0 of a [t, y, x] cube, computed with np.partition on blocks of
+    x columns so each block stays in cache (same result as np.median for finite data)
+    """
+    t = cube.shape[0]
+    k = t // 2
+    kth = [k - 1, k] if t % 2 == 0 else [k]
+    med = np.empty(cube.shape[1:], dtype=np.result_type(cube.dtype, np.float32))
+    for x0 in range(0, cube.shape[2], block):
+        part = np.partition(cube[:, :, x0:x0 + block], kth, axis=0)
+        if t % 2 == 0:
+            med[:, x0:x0 + block] = 0.5 * (part[k - 1] + part[k])
+        else:
+            med[:, x0:x0 + block] = part[k]
+    return med
+
+
+def robust_sigmas(vals: np.ndarray) -> np.ndarray:
+    """
+    robust sigma (1.4826 * mad) per row of a [t, n] array of in-mask values;
+    rows with a zero/non-finite mad fall back to their std, then to 1.0
+    """
+    if vals.shape[1] == 0:
+        return np.ones(vals.shape[0])
+    meds = np.median(vals, axis=1)
+    s = 1.4826 * np.median(np.abs(vals - meds[:, None]), axis=1)
+    bad = ~np.isfinite(s) | (s <= 0)
+    if bad.any():
+        std = np.std(vals[bad], axis=1)
+        s[bad] = np.where(std > 0, std, 1.0)
+    return s.astype(float)
+
+
 def write_point_srclist(results, out_yaml: Path,
                         score_threshold: float = 50.0,
                         max_sources: int = 2,
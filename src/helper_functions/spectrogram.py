@@ -4,11 +4,17 @@ import shutil
 import logging
 import tarfile
 import tempfile
+import warnings
 import numpy as np
-from casacore.tables import table, taql
+from casacore.tables import table
 from helper_functions.utils import safe_parse_time
 from maad.sound import median_equalizer
 
+MS_TIME_CHUNK = 16   # time steps (x all baselines) of DATA read per getcol call
+SPEC_DTYPE = np.float16   # log2 amplitudes (~0-30) only need display precision
+_CH_RE = re.compile(r'ch(\d+)(?:-|\.ms)')
+_NUM_RE = re.compile(r'(\d+)')
+
 
 def get_spectrogram(mwa_metadata, path_to_data):
     """
@@ -77,41 +83,13 @@ def get_dynamic_spec(fname=None, domedian=True):
             ms_path = os.path.join(temp_dir, ms_file.name)
             ms_path = os.path.normpath(ms_path)
 
-             # query the entire DATA column as a 3D array (nfreq × npol)
-            result = taql(f"SELECT DATA FROM '{ms_path}'")
-            data = result.getcol("DATA")  # shape: (nrows, nchan, npol)
-
-             # convert complex data to amplitude and extract polarization
-            amp = ( np.abs(data[:, :, 0]) + np.abs(data[:, :, 0]) ) / 2
-            amp = np.abs(data[:, :, 0])  # shape: (nrows, nchan)
-            amp = amp.T  # shape: (nchan, nrows) -> (freq, time)
-
              # get number of baselines
             nbl = get_nbl(ms_path)
-            ntime = data.shape[0] // nbl
 
             freqs = get_frequencies(ms_path)
             frequencies.extend([int(np.round(f)) for f in freqs])
 
-             # reshape and process
-            amp = ( np.abs(data[:, :, 0]) + np.abs(data[:, :, 3])) / 2  # average polarizations 0 and 3
-            amp = amp.reshape((ntime, nbl, -1))  # (time, baseline, freq)
-
-             # mask very small and invalid values
-            amp = np.ma.masked_where(amp < 1e-9, amp)
-            amp = np.ma.masked_invalid(amp)
-
-             # average over baselines
-            if domedian:
-                ospec = np.ma.median(amp, axis=1).T  # shape: (freq, time)
-            else:
-                ospec = np.ma.mean(amp, axis=1).T
-
-             # log scale specrogram
-            ospec = np.ma.masked_invalid(ospec)
-            ospec = np.ma.log2(np.ma.clip(ospec, 1, None))
-
-            spectrograms.append(ospec)
+            spectrograms.append(read_ms_spectrum(ms_path, nbl, len(freqs), domedian).astype(SPEC_DTYPE))
 
     finally:
          # clean up the temporary directory after your operations
@@ -124,6 +102,50 @@ def get_dynamic_spec(fname=None, domedian=True):
     return dspec_entity
 
 
+def read_ms_spectrum(ms_path, nbl, nchan, domedian=True, time_chunk=MS_TIME_CHUNK):
+    """
+    stream the DATA column in blocks of whole time steps and reduce each block
+    to (freq, time) straight away, so only one block of complex data is in memory
+    """
+    tb = table(ms_path, ack=False)
+    try:
+        ntime = tb.nrows() // nbl
+        ospec = np.empty((nchan, ntime), dtype=np.float32)
+        for t0 in range(0, ntime, time_chunk):
+            t1 = min(t0 + time_chunk, ntime)
+            data = tb.getcol("DATA", startrow=t0 * nbl, nrow=(t1 - t0) * nbl)  # (rows, nchan, npol)
+            ospec[:, t0:t1] = baseline_averaged_amplitude(data, t1 - t0, nbl, domedian)
+            del data
+    finally:
+        tb.close()
+    return ospec
+
+
+def baseline_averaged_amplitude(data, ntime, nbl, domedian=True):
+    """
+    log2 amplitude spectrum (freq, time) from complex DATA rows (ntime * nbl, nchan, npol):
+    polarizations 0 and 3 are averaged, then the baselines are reduced by median or mean.
+    very small and non-finite amplitudes are ignored (nan), empty cells stay nan
+    """
+     # average polarizations 0 and 3 into one float32 buffer
+    amp = np.empty(data.shape[:2], dtype=np.float32)
+    np.abs(data[:, :, 0], out=amp)
+    amp += np.abs(data[:, :, 3])
+    amp *= 0.5
+    amp[~np.isfinite(amp) | (amp < 1e-9)] = np.nan
+    amp = amp.reshape((ntime, nbl, -1))  # (time, baseline, freq)
+
+     # average over baselines (all-nan cells give nan without a warning)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        ospec = (np.nanmedian(amp, axis=1) if domedian else np.nanmean(amp, axis=1)).T  # (freq, time)
+
+     # log scale spectrogram, in place on the fresh reduction output (nan stays nan)
+    np.maximum(ospec, 1.0, out=ospec)
+    np.log2(ospec, out=ospec)
+    return ospec
+
+
 def get_ms_files(fname):
     """
     extracts ms files from a tar archive and returns them sorted by channel number if available.
@@ -144,12 +166,12 @@ def _extract_channel_or_fallback(name):
     """
     extracts channel number from filename or falls back to a large number to push it to the end
     """
-    match = re.search(r'ch(\d+)(?:-|\.ms)', name)
+    match = _CH_RE.search(name)
     if match:
         return int(match.group(1))
     else:
          # fallback: extract the full number if filename is like '1355089520.ms'
-        match = re.search(r'(\d+)', name)
+        match = _NUM_RE.search(name)
         if match:
             return int(match.group(1))
         else:
@@ -186,8 +208,11 @@ def merge_spectrograms(spectrograms, times, time_res=4):
     merges spectrograms with time-aligned gaps, rounding timestamps to seconds
     """
     freq_axis = None
-    combined_spec, combined_times = [], []
+    combined_times = []
+    placed = []  # (spec, first column) for every kept spectrogram
+    width = 0
 
+     # first pass: decide which spectrograms are kept and where each one starts
     for i, (dspec, (start, end)) in enumerate(zip(spectrograms, times)):
         start = safe_parse_time(start)
         end = safe_parse_time(end)
@@ -204,15 +229,21 @@ def merge_spectrograms(spectrograms, times, time_res=4):
             prev_end = safe_parse_time(times[i - 1][1])
             if start > prev_end:
                 gap_sec = (start - prev_end).total_seconds()
-                gap_cols = int(np.round(gap_sec / time_res))
-                nan_gap = np.full((spec.shape[0], gap_cols), np.nan)
-                combined_spec.append(nan_gap)
+                width += int(np.round(gap_sec / time_res))
                 combined_times.append((prev_end, start))
 
-        combined_spec.append(spec)
+        placed.append((spec, width))
+        width += spec.shape[1]
         combined_times.append((start, end))
 
-    final_spec = np.hstack(combined_spec) if combined_spec else None
+    if not placed:
+        return None, combined_times, freq_axis
+
+     # second pass: copy into one preallocated array; gaps keep the nan fill
+    dtype = np.result_type(*(spec.dtype for spec, _ in placed))
+    final_spec = np.full((placed[0][0].shape[0], width), np.nan, dtype=dtype)
+    for spec, col in placed:
+        final_spec[:, col:col + spec.shape[1]] = spec
     return final_spec, combined_times, freq_axis
 
 
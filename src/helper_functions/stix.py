@@ -1,11 +1,61 @@
+import os
+import tempfile
 import numpy as np
 import pandas as pd
 from stixdcpy import auxiliary as aux
 from stixdcpy.quicklook import LightCurves
-from helper_functions.utils import set_x_ticks
+from helper_functions.utils import set_x_ticks, safe_parse_time
 import logging
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
+try:
+    from joblib import Memory  # optional, disk cache for stix data center requests
+    _MEM = Memory(os.environ.get("STIX_CACHE_DIR", os.path.join(tempfile.gettempdir(), "stix_cache")), verbose=0)
+except ImportError:
+    _MEM = None
+
+
+def _disk_cached(func):
+    """
+    cache func on disk with joblib when available; calls that raise are not cached,
+    so the wrapped functions raise on empty sdc replies (see _EmptySdcReply)
+    """
+    return _MEM.cache(func) if _MEM is not None else func
+
+
+class _EmptySdcReply(Exception):
+    """
+    raised instead of returning an sdc reply without data, which would otherwise be
+    cached and served for good after one transient outage; carries the reply
+    """
+
+    def __init__(self, reply):
+        super().__init__("empty reply from the stix data center")
+        self.reply = reply
+
+
+def _utc_key(t):
+    """
+    second-precision iso string, so equal flare windows share one cache entry
+    """
+    return safe_parse_time(t).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+@_disk_cached
+def _light_curves_from_sdc(start_utc: str, end_utc: str):
+    lc = LightCurves.from_sdc(start_utc, end_utc, ltc=True)
+    if not lc.data:
+        raise _EmptySdcReply(lc)
+    return lc
+
+
+@_disk_cached
+def _ephemeris_from_sdc(start_utc: str, end_utc: str):
+    emph = aux.Ephemeris.from_sdc(start_utc=start_utc, end_utc=end_utc, steps=1)
+    if not emph.data:
+        raise _EmptySdcReply(emph)
+    return emph
+
 
 def get_flarelist(path_to_flarelist):
     """
@@ -22,7 +72,9 @@ def load_stix_light_curve(start_utc, end_utc):
     load stix light curve data
     """
     try:
-        return LightCurves.from_sdc(start_utc, end_utc, ltc=True)
+        return _light_curves_from_sdc(_utc_key(start_utc), _utc_key(end_utc))
+    except _EmptySdcReply as e:
+        return e.reply      # uncached; plot_stix_light_curve reports it as not available
     except Exception as e:
         logging.info(f"Error loading light curves: {e}")
 
@@ -32,7 +84,9 @@ def get_position(start, end):
     get flare position from stix metadata
     """
     try:
-        return aux.Ephemeris.from_sdc(start_utc=start, end_utc=end, steps=1)
+        return _ephemeris_from_sdc(_utc_key(start), _utc_key(end))
+    except _EmptySdcReply as e:
+        return e.reply
     except Exception as e:
         logging.info(f"Error loading position data: {e}")
 
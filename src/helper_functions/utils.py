@@ -1,5 +1,8 @@
 import os
+import json
 import rootutils
+import numpy as np
+from functools import lru_cache
 from pathlib import Path
 from dateutil import parser
 from dotenv import load_dotenv
@@ -7,7 +10,9 @@ from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
 import tarfile
 import tempfile
 import re
-import shutil, time, stat
+import shutil, time, stat, hashlib
+import subprocess
+import threading
 import logging
 
  # setup project root and environment variables immediately
@@ -17,6 +22,16 @@ load_dotenv()
  # define root path to data
 ROOT_PATH_TO_DATA = Path(os.getenv("ROOT_PATH_TO_DATA", None))
 
+ # mwa beam model for hyperdrive and wsclean; an MWA_BEAM_FILE already set in the shell wins
+MWA_BEAM_FILE = os.getenv("MWA_BEAM_FILE", str(Path.home() / "local/share/mwa_full_embedded_element_pattern.h5"))
+
+
+def mwa_tool_env():
+    """
+    copy of the process environment with MWA_BEAM_FILE set, for hyperdrive/wsclean subprocesses
+    """
+    return {**os.environ, "MWA_BEAM_FILE": MWA_BEAM_FILE}
+
 
 def get_root_path_to_data():
     """
@@ -31,7 +46,16 @@ def safe_parse_time(t):
     """
     safely parse time string to datetime
     """
-    return parser.parse(t).replace(microsecond=0) if isinstance(t, str) else t.replace(microsecond=0)
+    return _parse_time_str(t) if isinstance(t, str) else t.replace(microsecond=0)
+
+
+@lru_cache(maxsize=4096)
+def _parse_time_str(t: str):
+    """
+    cached dateutil parse: plotting re-parses the same few flare/observation timestamps
+    (datetimes are immutable, so sharing cached results is safe)
+    """
+    return parser.parse(t).replace(microsecond=0)
 
 
 def set_x_ticks(ax):
@@ -44,47 +68,231 @@ def set_x_ticks(ax):
     ax.xaxis.set_major_formatter(formatter)
 
 
+def spectrogram_display(data, percentiles=(1, 99)):
+    """
+    prepare a spectrogram for imshow: float32 copy (masked entries as nan) and
+    vmin/vmax from the given nan-percentiles, so matplotlib skips its own min/max scan
+    """
+    data = np.ma.filled(np.ma.asarray(data).astype(np.float32, copy=False), np.nan)
+    if not np.isfinite(data).any():
+        return data, None, None
+    vmin, vmax = np.nanpercentile(data, percentiles)
+    return data, float(vmin), float(vmax)
+
+
 def get_observation_path(observation_id):
     """
     return path to mwa observation directory
     """
     root = get_root_path_to_data()
-    candidates = [p for p in root.glob(f"*{observation_id}*.tar") if p.is_file()]
+    obs = str(observation_id)
+    candidates = [name for name in _tar_listing(str(root), os.stat(root).st_mtime_ns) if obs in name]
     if not candidates:
         raise FileNotFoundError(f"no archive found for {observation_id} in {root}")
-    return candidates[0]
+    return root / candidates[0]
+
+
+@lru_cache(maxsize=1)
+def _tar_listing(root: str, mtime_ns: int) -> tuple:
+    """
+    names of the *.tar files in root; one scandir per directory mtime, so repeated
+    lookups (e.g. over a whole flare list) don't re-read the data directory
+    """
+    with os.scandir(root) as it:
+        return tuple(sorted(e.name for e in it if e.name.endswith(".tar") and e.is_file()))
+
+
+_EXTRACTED_MS: dict = {}   # (tar path, scratch root) -> extracted ms path
+_EXTRACTED_MS_LOCK = threading.Lock()
 
 
 def get_ms_files(tar_path, scratch_root):
     """
     extract only one *.ms, corresponding to one freq range, from *tar_path* and return (ms_path, tmp_dir)
+    the member list comes from a sidecar index (see _load_or_build_index), so repeat
+    calls neither rescan the archive headers nor go through tarfile for plain members;
+    an ms already extracted from the same tar into the same scratch root is reused
+    (e.g. when the calibrator is also imaged) as long as it still exists
+    """
+    key = (str(Path(tar_path).resolve()), str(Path(scratch_root).resolve()))
+    with _EXTRACTED_MS_LOCK:
+        cached = _EXTRACTED_MS.get(key)
+    if cached is not None and cached.is_dir():
+        logging.info(f"reusing extracted {cached}")
+        return cached
+
+    ms_path = _extract_first_ms(tar_path, scratch_root)
+    with _EXTRACTED_MS_LOCK:
+        _EXTRACTED_MS[key] = ms_path
+    return ms_path
+
+
+def _extract_first_ms(tar_path, scratch_root):
+    """
+    get_ms_files body: extract the lowest-channel *.ms subtree into a fresh temp dir
+    """
+    index = _load_or_build_index(tar_path)
+
+    # find the first directory that ends with '.ms'
+    ms_names = sorted(
+        [e for e in index if e[3] == "dir" and e[0].endswith(".ms")],
+        key=lambda e: int(e[0].split("ch")[1].split("-")[0]),   # grab first channel as int
+    )
+    if not ms_names:
+        raise ValueError("no .ms directory found in archive")
+
+    logging.info([e[0] for e in ms_names])
+
+    ms_dirname = ms_names[0][0]
+    logging.info(f"extracting {ms_dirname}")
+
+    # collect that directory plus every member under it
+    prefix = ms_dirname.rstrip("/") + "/"
+    members = [e for e in index if e[0] == ms_dirname or e[0].startswith(prefix)]
+
+    # create a temporary workspace on scratch_root
+    tmp_dir = Path(tempfile.mkdtemp(dir=scratch_root))
+    if all(e[3] in ("dir", "file") for e in members):
+        _extract_indexed(tar_path, members, tmp_dir)
+    elif shutil.which("tar"):
+        # links or other special members: native tar extracts the whole subtree by name
+        subprocess.run(["tar", "-xf", str(tar_path), "-C", str(tmp_dir), ms_dirname], check=True)
+    else:
+        # no tar binary: let tarfile handle the subtree
+        with tarfile.open(tar_path, "r") as tar:
+            _fadvise(tar.fileobj.fileno(), 0, 0, "POSIX_FADV_SEQUENTIAL")
+            names = {e[0] for e in members}
+            _extract_members(tar, [m for m in tar.getmembers() if m.name in names], tmp_dir)
+
+    return tmp_dir / ms_dirname.lstrip("./")
+
+
+# tar index sidecars live under the work dir (run_wsclean's work_base), not next to the
+# archives: writing into the data directory would bump its mtime and invalidate the
+# mtime-keyed listing caches and the metafits last-check marker
+TAR_INDEX_DIR = ROOT_PATH_TO_DATA / "tmp" / "tar_index"
+
+
+def _tar_index_path(tar_path: Path) -> Path:
+    """
+    sidecar path for one archive, keyed on its resolved path so equal names in
+    different directories don't collide
+    """
+    key = hashlib.sha1(str(tar_path.resolve()).encode()).hexdigest()[:12]
+    return TAR_INDEX_DIR / f"{tar_path.name}.{key}.idx"
+
+
+def _load_or_build_index(tar_path):
+    """
+    [(name, offset_data, size, kind)] for every tar member, kind in dir/file/other
+    cached in a json sidecar under TAR_INDEX_DIR, tagged with the tar's size and mtime so
+    a replaced archive is re-indexed; an unwritable location just skips the sidecar
+    sparse members count as other: their data blocks are not a plain byte range
     """
+    tar_path = Path(tar_path)
+    st = tar_path.stat()
+    idx_path = _tar_index_path(tar_path)
+    try:
+        with open(idx_path) as f:
+            cached = json.load(f)
+        if cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return [tuple(e) for e in cached["members"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
 
     with tarfile.open(tar_path, "r") as tar:
-        # find the first directory that ends with '.ms'
-        ms_names = sorted(
-            [m for m in tar.getmembers()
-            if m.isdir() and m.name.endswith(".ms")],
-            key=lambda s: int(s.name.split("ch")[1].split("-")[0]),   # grab first channel as int
-        )
-        if not ms_names:
-            raise ValueError("no .ms directory found in archive")
-
-        logging.info(ms_names)
-        
-        ms_dirinfo = ms_names[0]
-        logging.info(f"extracting {ms_dirinfo.name}")
-
-        # collect that directory plus every member under it
-        prefix = ms_dirinfo.name.rstrip("/") + "/"
-        members = [m for m in tar.getmembers()
-                   if m.name == ms_dirinfo.name or m.name.startswith(prefix)]
-                   
-        # create a temporary workspace on scratch_root
-        tmp_dir = tempfile.mkdtemp(dir=scratch_root)
-        tar.extractall(path=tmp_dir, members=members)
-
-    return Path(tmp_dir) / ms_dirinfo.name.lstrip("./")
+        index = [
+            (m.name, m.offset_data, m.size,
+             "dir" if m.isdir() else "file" if m.isreg() and not m.issparse() else "other")
+            for m in tar.getmembers()
+        ]
+    try:
+        idx_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(idx_path, "w") as f:
+            json.dump({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "members": index}, f)
+    except OSError as e:
+        logging.debug(f"could not write tar index {idx_path}: {e}")
+    return index
+
+
+def _extract_indexed(tar_path, members, dest: Path):
+    """
+    extract dir/file index entries by seeking straight to their data blocks
+    (entries are processed in archive order, so the reads move forward through the tar)
+    """
+    with open(tar_path, "rb") as src:
+        _fadvise(src.fileno(), 0, 0, "POSIX_FADV_SEQUENTIAL")
+        for name, offset, size, kind in sorted(members, key=lambda e: e[1]):
+            target = dest / name.lstrip("./")
+            if kind == "dir":
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            src.seek(offset)
+            with open(target, "wb") as dst:
+                remaining = size
+                while remaining:
+                    chunk = src.read(min(TAR_COPY_CHUNK, remaining))
+                    if not chunk:
+                        raise EOFError(f"unexpected end of {tar_path} in {name}")
+                    dst.write(chunk)
+                    remaining -= len(chunk)
+                _drop_large_file_cache(dst, size)
+            # the tar bytes are not read again
+            _fadvise(src.fileno(), offset, size, "POSIX_FADV_DONTNEED")
+
+
+TAR_COPY_CHUNK = 1 << 20
+FADVISE_MIN_BYTES = 64 << 20   # only bulk table files (visibilities) are dropped from the page cache
+
+
+def _fadvise(fd, offset, length, advice):
+    """
+    os.posix_fadvise when the platform has it; advice is the os constant's name
+    """
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, offset, length, getattr(os, advice))
+        except OSError:
+            pass
+
+
+def _drop_large_file_cache(f, size):
+    """
+    hint the kernel to drop a freshly written bulk file from the page cache, so
+    multi-GB visibility columns don't evict the small ms metadata files wsclean opens
+    """
+    if size >= FADVISE_MIN_BYTES:
+        f.flush()
+        # DONTNEED skips dirty pages, so write the file back first
+        getattr(os, "fdatasync", os.fsync)(f.fileno())
+        _fadvise(f.fileno(), 0, 0, "POSIX_FADV_DONTNEED")
+
+
+def _copy_member(tar, member, dest: Path):
+    """
+    write one regular tar member to dest by streaming its bytes (no per-member
+    stat/chmod/utime work as in tar.extract); member is the TarInfo, not its name
+    """
+    with tar.extractfile(member) as src, open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst, TAR_COPY_CHUNK)
+        _drop_large_file_cache(dst, member.size)
+
+
+def _extract_members(tar, members, dest: Path):
+    """
+    extract the given members (in archive order) below dest; directories are created,
+    regular files streamed, anything else (links etc.) falls back to tar.extract
+    """
+    for m in members:
+        target = dest / m.name.lstrip("./")
+        if m.isdir():
+            target.mkdir(parents=True, exist_ok=True)
+        elif m.isreg():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            _copy_member(tar, m, target)
+        else:
+            tar.extract(m, path=dest)
 
 
 def find_data_column(ms_path: Path) -> str:
@@ -106,14 +314,28 @@ def reset_dir(path: Path):
 
 def get_time_info(ms_path: Path):
     """return (start_time, interval_size, interval_count)"""
-    obs = table(str(ms_path))
-    obs.unlock()
-    centers = obs.getcol("TIME")
-    sizes   = obs.getcol("INTERVAL")
-    radius  = sizes / 2.0
-    mjd0    = np.min(centers - radius) / 86400.0
-    mjd1    = np.max(centers + radius) / 86400.0
-    dt      = TimeDelta(sizes[0], format="sec")
+    return _time_info(str(ms_path), os.stat(Path(ms_path) / "table.dat").st_mtime_ns)
+
+
+@lru_cache(maxsize=64)
+def _time_info(ms_path: str, mtime_ns: int):
+    """
+    get_time_info body; cached per ms and main table mtime (Time/TimeDelta are immutable)
+    """
+    from casacore.tables import taql
+    from astropy.time import Time, TimeDelta
+    # aggregate in taql instead of pulling the full TIME / INTERVAL columns
+    r = taql(
+        "SELECT gmin(TIME-INTERVAL/2) AS t0, gmax(TIME+INTERVAL/2) AS t1, "
+        f"gmin(INTERVAL) AS imin, gmax(INTERVAL) AS imax FROM '{ms_path}'"
+    )
+    t0, t1, imin, imax = (float(r.getcell(c, 0)) for c in ("t0", "t1", "imin", "imax"))
+    r.close()
+    if imin != imax:
+        logging.warning(f"non-uniform integration intervals in {ms_path}: {imin}–{imax} s")
+    mjd0    = t0 / 86400.0
+    mjd1    = t1 / 86400.0
+    dt      = TimeDelta(imin, format="sec")
     count   = int((mjd1 - mjd0) * 86400 / dt.sec)
     return Time(mjd0, format="mjd", scale="utc"), dt, count
 
@@ -122,6 +344,15 @@ def ms_central_frequency(ms_path: Path) -> float:
     """
     read the mean channel frequency [hz] from the spectral_window table
     """
+    spw_dat = Path(ms_path) / "SPECTRAL_WINDOW" / "table.dat"
+    return _central_frequency(str(ms_path), os.stat(spw_dat).st_mtime_ns)
+
+
+@lru_cache(maxsize=64)
+def _central_frequency(ms_path: str, mtime_ns: int) -> float:
+    """
+    ms_central_frequency body; cached per ms and spectral_window table mtime
+    """
     from casacore.tables import table
     spw = table(f"{ms_path}::SPECTRAL_WINDOW")
     freqs = spw.getcol("CHAN_FREQ")  # shape: (nspw, nchan) or (nchan,)
@@ -135,7 +366,17 @@ def _extract_metafits_from_tar(metafits_root: str, obs_id: str) -> Path:
     find and extract the .metafits that matches obs_id from a *_vis_meta.tar
     the search is recursive under metafits_root and prefers tar files whose
     name contains the obs_id.
+    the tar is searched and read once per (root, obs_id) unless the extracted file disappears
     """
+    extracted = _extract_metafits_cached(str(metafits_root), str(obs_id))
+    if not extracted.exists():
+        _extract_metafits_cached.cache_clear()
+        extracted = _extract_metafits_cached(str(metafits_root), str(obs_id))
+    return extracted
+
+
+@lru_cache(maxsize=64)
+def _extract_metafits_cached(metafits_root: str, obs_id: str) -> Path:
     root = Path(metafits_root)
     # search for matching vis_meta tars
     patt1 = list(root.rglob(f"{obs_id}_*_vis_meta.tar"))
@@ -148,17 +389,30 @@ def _extract_metafits_from_tar(metafits_root: str, obs_id: str) -> Path:
     out_dir = TMP_DIR / f"{obs_id}_metafits"
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    with tarfile.open(tar_path, "r") as tf:
-        # prefer a .metafits file whose filename contains the obs_id
-        members = [m for m in tf.getmembers() if m.name.lower().endswith(".metafits")]
-        if not members:
-            raise FileNotFoundError(f"no .metafits inside {tar_path}")
-        mf = next((m for m in members if obs_id in Path(m.name).name), members[0])
-
-        tf.extract(mf, path=out_dir)
-        extracted = out_dir / Path(mf.name).name
-        if not extracted.exists():
-            raise FileNotFoundError(f"failed to extract to {extracted}")
+    # single forward pass in stream mode: prefer a .metafits whose filename contains
+    # the obs_id and stop there; the first .metafits is kept as fallback on the way
+    extracted = fallback = None
+    with tarfile.open(tar_path, "r|") as tf:
+        for m in tf:
+            if not (m.isreg() and m.name.lower().endswith(".metafits")):
+                continue
+            name = Path(m.name).name
+            if obs_id in name:
+                extracted = out_dir / name
+                _copy_member(tf, m, extracted)
+                break
+            if fallback is None:
+                fallback = out_dir / name
+                _copy_member(tf, m, fallback)
+
+    if extracted is None:
+        extracted = fallback
+    elif fallback is not None and fallback != extracted:
+        fallback.unlink(missing_ok=True)
+    if extracted is None:
+        raise FileNotFoundError(f"no .metafits inside {tar_path}")
+    if not extracted.exists():
+        raise FileNotFoundError(f"failed to extract to {extracted}")
 
     logging.info("extracted metafits (%s) → %s", tar_path.name, extracted)
     return extracted
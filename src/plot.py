@@ -11,10 +11,13 @@ plots:
 import os
 import gc
 import logging 
+import multiprocessing
 import traceback
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from helper_functions.stix import get_flarelist
-from helper_functions.plot_flare import plot_flare
+from helper_functions.plot_flare import plot_flare, create_figure_and_axes
 
 
 def main():
@@ -29,7 +32,7 @@ def main():
         plot_by_observations(observations, save_folder)
     else:
         flare_csv = "../files/flares_recorded_by_mwa_G0002_vfe_true.csv"
-        plot_by_flarelist(save_folder, flare_csv, flare_range=(0, 250))  # None or e.g. flare_range=(0, 3000)
+        plot_by_flarelist(save_folder, flare_csv, flare_range=(0, 250), n_workers=1)  # None or e.g. flare_range=(0, 3000)
 
 
 def plot_by_observations(observations, save_folder):
@@ -44,38 +47,75 @@ def plot_by_observations(observations, save_folder):
     plot_flare(save_path=save_path, obs_ids=observations)
 
 
-def plot_by_flarelist(save_folder, flare_csv, flare_range=None):
+def plot_by_flarelist(save_folder, flare_csv, flare_range=None, n_workers=1):
     """
     plots spectrograms and light curves using flare metadata
+    n_workers > 1 renders flares in that many processes (each with its own figure)
     """
     os.makedirs(save_folder, exist_ok=True)
     flare_data = get_flarelist(flare_csv)
+    # existing outputs from one directory listing instead of a stat per flare
+    done = set(os.listdir(save_folder))
 
+    todo = []
     for i, flare_row in flare_data.iterrows():
         if flare_range and not (flare_range[0] <= i < flare_range[1]):
             continue
+        if f"{i+2}_flareID_{flare_row['flare_id']}.png" in done:
+            logging.info(f"Output for flare {i+2} with ID {flare_row['flare_id']} already exists. Skipping...")
+            continue
+        todo.append((i, flare_row, save_folder))
+
+    if n_workers > 1:
+        # flares are independent and rendering is cpu bound; pyplot is not thread safe,
+        # so use processes, each reusing one figure across its flares
+        with multiprocessing.Pool(n_workers, initializer=_init_plot_worker) as pool:
+            for _ in pool.imap_unordered(_plot_flare_job, todo, chunksize=4):
+                pass
+        return
+
+    _init_plot_worker()
+    for job in todo:
+        _plot_flare_job(job)
+    plt.close(_worker_figure[0])
+
 
-        save_path = os.path.join(save_folder, f"{i+2}_flareID_{flare_row['flare_id']}")
+_worker_figure = None
 
-        try:
-            logging.info(f"Processing flare {i+2} with ID {flare_row['flare_id']}")
-            
-            if os.path.exists(f"{save_path}.png"):
-                logging.info(f"Output file already exists. Skipping...")
-                continue
 
-            should_stop = plot_flare(save_path=save_path, row=flare_row)
-            if should_stop:
-                logging.info(f"Continuing...")
-                continue
+def _init_plot_worker():
+    """
+    create the figure this process reuses for all of its flares
+    """
+    global _worker_figure
+    _worker_figure = create_figure_and_axes(subplots=5)
 
-        except Exception as e:
-            logging.error(f"{e} \n{traceback.format_exc()}")
 
-        finally:
-            plt.close('all')
-            gc.collect()
-            logging.info(f"***************************************")
+def _plot_flare_job(job):
+    """
+    plot one flare (i, flare_row, save_folder) into this process's figure
+    """
+    i, flare_row, save_folder = job
+    figure = _worker_figure
+    save_path = os.path.join(save_folder, f"{i+2}_flareID_{flare_row['flare_id']}")
+
+    try:
+        logging.info(f"Processing flare {i+2} with ID {flare_row['flare_id']}")
+
+        should_stop = plot_flare(save_path=save_path, row=flare_row, figure=figure)
+        if should_stop:
+            logging.info(f"Continuing...")
+
+    except Exception as e:
+        logging.error(f"{e} \n{traceback.format_exc()}")
+
+    finally:
+        # close anything else that was opened (e.g. debug figures), keep the batch figure
+        for num in plt.get_fignums():
+            if num != figure[0].number:
+                plt.close(num)
+        gc.collect()
+        logging.info(f"***************************************")
 
 
 if __name__ == "__main__":
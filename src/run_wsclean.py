@@ -2,8 +2,9 @@
 orchestrate calibration (optional) -> self-calibration (optional) -> wsclean -> imaging
 """
 from pathlib import Path
-import shutil, logging, datetime, os
+import shutil, logging, datetime, os, subprocess, uuid, hashlib
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from astropy.time import Time
 from helper_functions.utils import get_observation_path, get_ms_files, get_root_path_to_data, get_time_info
 import helper_functions.mwa_imaging as imaging
@@ -30,11 +31,14 @@ runs = [
 image_size_pixels = 2048
 scale_arcsec_per_pixel = 5
 niter = 10
+wsclean_shards = 1      # >1: image contiguous interval ranges in that many concurrent wsclean processes
+parallel_obs = 1        # >1: prepare and image that many observations of a run concurrently
 
 # paths
 root_path_to_data = get_root_path_to_data()
 work_base = Path(root_path_to_data) / "tmp"
 out_base  = Path.cwd().parent / "results" / "mwa_vids"
+cal_sol_cache = Path(root_path_to_data) / "cal_sol_cache"   # di solutions reused across runs
 # =============================================
 
 
@@ -58,62 +62,141 @@ def main():
         try:
             # optional calibration
             if calibration_id:
-                sol_path = work_root / f"{tag}_cal_sols.fits"
-                cal_ms = get_ms_files(get_observation_path(calibration_id), work_root)
-                cal.run_di_calibrate(cal_ms, flux_jy, sol_path, work_root)
+                sol_path = calibration_solutions(calibration_id, flux_jy, work_root)
             else:
                 sol_path = None
 
             # imaging for each science ms
-            cubes, axes = [], []
-
-            for obs_id in observation_ids:
-                raw_ms = get_ms_files(get_observation_path(obs_id), work_root)
-                ms_in = (
-                    cal.apply_solutions(raw_ms, sol_path, work_root)
-                    if sol_path else raw_ms
-                )
-                
-                # TODO: self-calibration not working correctly yet
-                if cfg["selfcal"]:
-                    # self-calibration loop using wsclean
-                    ms_in = self_calibrate(
-                        ms_in=ms_in,
-                        work_root=Path(work_root),
-                        iterations=1,
-                        wsclean_niter=5,
-                        auto_threshold=5.0,
-                    )
-
-                cube, times = process_single_obs(obs_id, ms_in, work_root)
-                cubes.append(cube)
-                axes.append(times)
-
-            # combine and animate
-            stack = np.concatenate(cubes)
-            all_times = Time(
-                np.concatenate([t.jd for t in axes]),
-                format="jd", scale="utc"
-            )
-            order = np.argsort(all_times.jd)
+            runs_out = image_observations(observation_ids, cfg, sol_path, work_root)
+
+            # stream frames of all observations, in time order, straight into the video
+            # (jd is taken once per run; one stable argsort orders all frame files)
+            jd_cat = np.concatenate([t.jd for _, t in runs_out])
+            order = np.argsort(jd_cat, kind="stable")
+            frames = [f for fr, _ in runs_out for f in fr]
+            frames = [frames[k] for k in order]
+            all_times = Time(jd_cat[order], format="jd", scale="utc")
             video_path = out_base / f"{flare_id}_{tag}.mp4"
-            imaging.animate_stack(stack[order], all_times[order], video_path)
+            imaging.animate_stack(imaging.iter_stokes_i_frames(frames), all_times, video_path)
             log.info("finished → %s", video_path)
         finally:
-            shutil.rmtree(work_root, ignore_errors=True)
+            discard_dir(work_root)
+
+
+def calibration_solutions(calibration_id: str, flux_jy: float, work_root: Path) -> Path:
+    """
+    di solutions for a calibrator, which depend only on (calibration_id, flux_jy):
+    reused from cal_sol_cache when present, else derived once and stored there
+    """
+    key = hashlib.sha1(f"{calibration_id}:{flux_jy}".encode()).hexdigest()
+    sol_path = cal_sol_cache / f"{calibration_id}_{key[:12]}_sols.fits"
+    if sol_path.exists():
+        log.info("reusing calibration solutions %s", sol_path)
+        return sol_path
+
+    cal_ms = get_ms_files(get_observation_path(calibration_id), work_root)
+    tmp_sols = work_root / f"{key[:12]}_cal_sols.fits"
+    cal.run_di_calibrate(cal_ms, flux_jy, tmp_sols, work_root)
+
+    # publish atomically so a crashed or concurrent run never leaves a partial file
+    cal_sol_cache.mkdir(parents=True, exist_ok=True)
+    staged = sol_path.with_name(f".{sol_path.name}.{uuid.uuid4().hex}")
+    shutil.copyfile(tmp_sols, staged)
+    os.replace(staged, sol_path)
+    return sol_path
+
+
+def discard_dir(path: Path):
+    """
+    remove a work directory without waiting for it: rename it out of the way (atomic on
+    the same filesystem) and let a detached `rm -rf` unlink the many small casa table files;
+    falls back to shutil.rmtree when the rename or the spawn fails
+    """
+    trash = path.parent / f".trash.{path.name}.{uuid.uuid4().hex}"
+    try:
+        os.rename(path, trash)
+    except FileNotFoundError:
+        return
+    except OSError:
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    try:
+        subprocess.Popen(["rm", "-rf", str(trash)], start_new_session=True,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        shutil.rmtree(trash, ignore_errors=True)
+
+
+def image_observations(observation_ids, cfg: dict, sol_path, work_root: Path):
+    """
+    run prepare_and_image_obs for every observation, returning results in input order
+    observations are independent and the work is in hyperdrive/wsclean subprocesses,
+    so threads are enough; when run one at a time (parallel_obs = 1), the next observation's
+    tar is extracted in a background thread while the current one is calibrated and imaged
+    """
+    if parallel_obs > 1:
+        with ThreadPoolExecutor(max_workers=parallel_obs) as pool:
+            return list(pool.map(
+                lambda obs_id: prepare_and_image_obs(obs_id, cfg, sol_path, work_root),
+                observation_ids
+            ))
+
+    def _extract(obs_id):
+        return get_ms_files(get_observation_path(obs_id), work_root)
+
+    runs_out = []
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        pending = prefetch.submit(_extract, observation_ids[0]) if observation_ids else None
+        for k, obs_id in enumerate(observation_ids):
+            raw_ms = pending.result()
+            if k + 1 < len(observation_ids):
+                pending = prefetch.submit(_extract, observation_ids[k + 1])
+            runs_out.append(prepare_and_image_obs(obs_id, cfg, sol_path, work_root, raw_ms=raw_ms))
+    return runs_out
+
+
+def prepare_and_image_obs(obs_id: str, cfg: dict, sol_path, work_root: Path, raw_ms: Path = None):
+    """
+    extract one science ms (unless already extracted), apply calibration and optional
+    selfcal, then image it
+    """
+    if raw_ms is None:
+        raw_ms = get_ms_files(get_observation_path(obs_id), work_root)
+    ms_in = (
+        cal.apply_solutions(raw_ms, sol_path, work_root)
+        if sol_path else raw_ms
+    )
+
+    # TODO: self-calibration not working correctly yet
+    if cfg["selfcal"]:
+        # self-calibration loop using wsclean
+        ms_in = self_calibrate(
+            ms_in=ms_in,
+            work_root=Path(work_root) / f"selfcal_{obs_id}",
+            iterations=1,
+            wsclean_niter=5,
+            auto_threshold=5.0,
+            wsclean_shards=wsclean_shards,
+        )
+
+    return process_single_obs(obs_id, ms_in, work_root)
 
 
 def process_single_obs(obs_id: str, ms_path: Path, work_root: Path):
-    """run wsclean on one ms and return (cube, time_axis)"""
+    """
+    run wsclean on one ms and return (frame_files, time_axis)
+    frames stay on disk under work_root until the animation has consumed them
+    """
     start, dt, n = get_time_info(ms_path)
     log.info(f"{obs_id}: {n} intervals of {dt.sec:.1f}s starting {start.iso}")
 
     obs_dir = work_root / obs_id
-    imaging.run_wsclean(ms_path, n, obs_dir, niter, image_size_pixels, scale_arcsec_per_pixel)
-    cube  = imaging.load_stokes_i_stack(obs_dir)
-    times = start + np.arange(len(cube)) * dt
-    shutil.rmtree(obs_dir, ignore_errors=True)
-    return cube, times
+    imaging.run_wsclean(ms_path, n, obs_dir, niter, image_size_pixels, scale_arcsec_per_pixel, shards=wsclean_shards)
+    frames = imaging.stokes_i_frame_files(obs_dir)
+    # one vectorized Time from (jd1, jd2 + offsets) instead of TimeDelta arithmetic
+    times  = Time(start.jd1, start.jd2 + np.arange(len(frames)) * (dt.sec / 86400.0),
+                  format="jd", scale=start.scale)
+    return frames, times
 
 
 if __name__ == "__main__":